@@ -15,6 +15,28 @@ from hydrus.client.db import ClientDBFilesStorage
 from hydrus.client.db import ClientDBModule
 from hydrus.client.db import ClientDBServices
 
+# a subtree this small is cheaper to fetch in one go and scan than to walk level by level
+VP_TREE_BUCKET_POPULATION = 32
+
+def DedupeHashIdsAndDistances( hash_ids_and_distances: typing.Iterable[ typing.Tuple[ int, int ] ] ) -> typing.List[ typing.Tuple[ int, int ] ]:
+    
+    # a file may turn up more than once at different distances, so we keep the smallest
+    
+    hash_ids_to_distances = {}
+    
+    for ( hash_id, distance ) in hash_ids_and_distances:
+        
+        current_distance = hash_ids_to_distances.get( hash_id, None )
+        
+        if current_distance is None or distance < current_distance:
+            
+            hash_ids_to_distances[ hash_id ] = distance
+            
+        
+    
+    return list( hash_ids_to_distances.items() )
+    
+
 class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
     
     def __init__( self, cursor: sqlite3.Cursor, modules_services: ClientDBServices.ClientDBMasterServices, modules_files_storage: ClientDBFilesStorage.ClientDBFilesStorage ):
@@ -27,17 +49,22 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         self._perceptual_hash_id_to_vp_tree_node_cache = {}
         self._non_vp_treed_perceptual_hash_ids = set()
         self._root_node_perceptual_hash_id = None
+        self._perceptual_hash_id_to_vp_tree_bucket_cache = {}
+        
+        self._perceptual_hashes_to_perceptual_hash_ids_cache = {}
+        
+        self._maintenance_due_cache = None
+        
+        self._InitCaches()
         
     
     def _AddLeaf( self, perceptual_hash_id, perceptual_hash ):
         
-        result = self._Execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
+        root_node_perceptual_hash_id = self._GetRootNodePerceptualHashId()
         
         parent_id = None
         
-        if result is not None:
-            
-            ( root_node_perceptual_hash_id, ) = result
+        if root_node_perceptual_hash_id is not None:
             
             ancestors_we_are_inside = []
             ancestors_we_are_outside = []
@@ -118,6 +145,11 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         
         self._ClearPerceptualHashesFromVPTreeNodeCache( ( perceptual_hash_id, ) )
         
+        if root_node_perceptual_hash_id is None:
+            
+            self._root_node_perceptual_hash_id = perceptual_hash_id
+            
+        
     
     def _GenerateBranch( self, job_status, parent_id, perceptual_hash_id, perceptual_hash, children ):
         
@@ -212,6 +244,21 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         self._ClearPerceptualHashesFromVPTreeNodeCache( all_altered_phash_ids )
         
     
+    def _GetHashIdsFromPerceptualHashIds( self, perceptual_hash_ids: typing.Collection[ int ] ) -> typing.List[ int ]:
+        
+        if len( perceptual_hash_ids ) == 0:
+            
+            return []
+            
+        
+        with self._MakeTemporaryIntegerTable( perceptual_hash_ids, 'phash_id' ) as temp_table_name:
+            
+            hash_ids = self._STL( self._Execute( f'SELECT hash_id FROM {temp_table_name} CROSS JOIN shape_perceptual_hash_map USING ( phash_id );' ) )
+            
+        
+        return hash_ids
+        
+    
     def _GetHashIdsWithPixelHashId( self, pixel_hash_id: int ) -> typing.Set[ int ]:
         
         pixel_dupe_hash_ids = self._STS( self._Execute( 'SELECT hash_id FROM pixel_hash_map WHERE pixel_hash_id = ?;', ( pixel_hash_id, ) ) )
@@ -262,6 +309,16 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
     
     def _GetPerceptualHashId( self, perceptual_hash, do_not_create = False ):
         
+        if perceptual_hash in self._perceptual_hashes_to_perceptual_hash_ids_cache:
+            
+            return self._perceptual_hashes_to_perceptual_hash_ids_cache[ perceptual_hash ]
+            
+        
+        if len( self._perceptual_hashes_to_perceptual_hash_ids_cache ) > 100000:
+            
+            self._perceptual_hashes_to_perceptual_hash_ids_cache = {}
+            
+        
         result = self._Execute( 'SELECT phash_id FROM shape_perceptual_hashes WHERE phash = ?;', ( sqlite3.Binary( perceptual_hash ), ) ).fetchone()
         
         if result is None:
@@ -282,9 +339,27 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             ( perceptual_hash_id, ) = result
             
         
+        # we only cache ids that exist, so a do_not_create miss is always checked again
+        self._perceptual_hashes_to_perceptual_hash_ids_cache[ perceptual_hash ] = perceptual_hash_id
+        
         return perceptual_hash_id
         
     
+    def _GetRootNodePerceptualHashId( self ) -> typing.Optional[ int ]:
+        
+        if self._root_node_perceptual_hash_id is None:
+            
+            result = self._Execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
+            
+            if result is not None:
+                
+                ( self._root_node_perceptual_hash_id, ) = result
+                
+            
+        
+        return self._root_node_perceptual_hash_id
+        
+    
     def _GetPerceptualHashIdsFromHashId( self, hash_id: int ) -> typing.Set[ int ]:
         
         perceptual_hash_ids = self._STS( self._Execute( 'SELECT phash_id FROM shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
@@ -308,6 +383,14 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
         
     
+    def _InitCaches( self ):
+        
+        if self._Execute( 'SELECT 1 FROM sqlite_master WHERE name = ?;', ( 'shape_vptree', ) ).fetchone() is not None:
+            
+            self._GetRootNodePerceptualHashId()
+            
+        
+    
     def _PopBestRootNode( self, node_rows ):
         
         if len( node_rows ) == 1:
@@ -433,6 +516,9 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         
         self._ClearPerceptualHashesFromVPTreeNodeCache( unbalanced_perceptual_hash_ids )
         
+        # this branch may sit inside a bucket further up the tree, and some of its ids are about to be deleted, so buckets are cheapest to just forget
+        self._perceptual_hash_id_to_vp_tree_bucket_cache = {}
+        
         self._ExecuteMany( 'DELETE FROM shape_maintenance_branch_regen WHERE phash_id = ?;', ( ( p_id, ) for p_id in unbalanced_perceptual_hash_ids ) )
         
         with self._MakeTemporaryIntegerTable( unbalanced_perceptual_hash_ids, 'phash_id' ) as temp_perceptual_hash_ids_table_name:
@@ -444,6 +530,8 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         
         self._ExecuteMany( 'DELETE FROM shape_perceptual_hashes WHERE phash_id = ?;', ( ( p_id, ) for p_id in orphan_perceptual_hash_ids ) )
         
+        self._ClearPerceptualHashesFromPerceptualHashIdCache( [ p_h for ( p_id, p_h ) in unbalanced_nodes if p_id in orphan_perceptual_hash_ids ] )
+        
         useful_nodes = [ row for row in unbalanced_nodes if row[0] in useful_perceptual_hash_ids ]
         
         useful_population = len( useful_nodes )
@@ -495,6 +583,17 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
         
     
+    def _ClearPerceptualHashesFromPerceptualHashIdCache( self, perceptual_hashes: typing.Collection[ bytes ] ):
+        
+        for perceptual_hash in perceptual_hashes:
+            
+            if perceptual_hash in self._perceptual_hashes_to_perceptual_hash_ids_cache:
+                
+                del self._perceptual_hashes_to_perceptual_hash_ids_cache[ perceptual_hash ]
+                
+            
+        
+    
     def _ClearPerceptualHashesFromVPTreeNodeCache( self, perceptual_hash_ids: typing.Collection[ int ] ):
         
         for perceptual_hash_id in perceptual_hash_ids:
@@ -506,9 +605,9 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             self._non_vp_treed_perceptual_hash_ids.discard( perceptual_hash_id )
             
-            if self._root_node_perceptual_hash_id == perceptual_hash_id:
+            if perceptual_hash_id in self._perceptual_hash_id_to_vp_tree_bucket_cache:
                 
-                self._root_node_perceptual_hash_id = None
+                del self._perceptual_hash_id_to_vp_tree_bucket_cache[ perceptual_hash_id ]
                 
             
         
@@ -521,6 +620,56 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
         
     
+    def _TryToPopulatePerceptualHashToVPTreeBucketCache( self, perceptual_hash_ids: typing.Collection[ int ] ):
+        
+        if len( self._perceptual_hash_id_to_vp_tree_bucket_cache ) > 100000:
+            
+            self._perceptual_hash_id_to_vp_tree_bucket_cache = {}
+            
+        
+        uncached_perceptual_hash_ids = { perceptual_hash_id for perceptual_hash_id in perceptual_hash_ids if perceptual_hash_id not in self._perceptual_hash_id_to_vp_tree_bucket_cache }
+        
+        if len( uncached_perceptual_hash_ids ) > 0:
+            
+            with self._MakeTemporaryIntegerTable( uncached_perceptual_hash_ids, 'phash_id' ) as temp_table_name:
+                
+                cte_table_name = 'bucket ( bucket_root_phash_id, bucket_phash_id )'
+                initial_select = 'SELECT phash_id, phash_id FROM {}'.format( temp_table_name )
+                recursive_select = 'SELECT bucket_root_phash_id, phash_id FROM shape_vptree, bucket ON parent_id = bucket_phash_id'
+                query_on_cte_table_name = 'SELECT bucket_root_phash_id, bucket_phash_id, phash FROM bucket, shape_perceptual_hashes ON phash_id = bucket_phash_id'
+                
+                # UNION, not UNION ALL, for the same damaged cyclic graph reason as in _RegenerateBranch
+                query = 'WITH RECURSIVE {} AS ( {} UNION {} ) {};'.format( cte_table_name, initial_select, recursive_select, query_on_cte_table_name )
+                
+                rows = self._Execute( query ).fetchall()
+                
+            
+            # a bucket is stored as two parallel tuples, ( member_ids, member_perceptual_hashes ), so the scan is one tight loop over the hashes and we only look up an id on a hit
+            
+            uncached_perceptual_hash_ids_to_bucket_rows = { perceptual_hash_id : [] for perceptual_hash_id in uncached_perceptual_hash_ids }
+            
+            for ( bucket_root_perceptual_hash_id, perceptual_hash_id, perceptual_hash ) in rows:
+                
+                uncached_perceptual_hash_ids_to_bucket_rows[ bucket_root_perceptual_hash_id ].append( ( perceptual_hash_id, HydrusData.ConvertPerceptualHashToInt( perceptual_hash ) ) )
+                
+            
+            for ( bucket_root_perceptual_hash_id, bucket_rows ) in uncached_perceptual_hash_ids_to_bucket_rows.items():
+                
+                if len( bucket_rows ) == 0:
+                    
+                    bucket = ( (), () )
+                    
+                else:
+                    
+                    bucket = tuple( zip( *bucket_rows ) )
+                    
+                
+                self._perceptual_hash_id_to_vp_tree_bucket_cache[ bucket_root_perceptual_hash_id ] = bucket
+                
+            
+            
+        
+    
     def _TryToPopulatePerceptualHashToVPTreeNodeCache( self, perceptual_hash_ids: typing.Collection[ int ] ):
         
         if len( self._perceptual_hash_id_to_vp_tree_node_cache ) > 1000000:
@@ -541,18 +690,18 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
                 
                 ( uncached_perceptual_hash_id, ) = uncached_perceptual_hash_ids
                 
-                rows = self._Execute( 'SELECT phash_id, phash, radius, inner_id, outer_id FROM shape_perceptual_hashes CROSS JOIN shape_vptree USING ( phash_id ) WHERE phash_id = ?;', ( uncached_perceptual_hash_id, ) ).fetchall()
+                rows = self._Execute( 'SELECT phash_id, phash, radius, inner_id, inner_population, outer_id, outer_population FROM shape_perceptual_hashes CROSS JOIN shape_vptree USING ( phash_id ) WHERE phash_id = ?;', ( uncached_perceptual_hash_id, ) ).fetchall()
                 
             else:
                 
                 with self._MakeTemporaryIntegerTable( uncached_perceptual_hash_ids, 'phash_id' ) as temp_table_name:
                     
                     # temp perceptual_hash_ids to actual perceptual_hashes and tree info
-                    rows = self._Execute( 'SELECT phash_id, phash, radius, inner_id, outer_id FROM {} CROSS JOIN shape_perceptual_hashes USING ( phash_id ) CROSS JOIN shape_vptree USING ( phash_id );'.format( temp_table_name ) ).fetchall()
+                    rows = self._Execute( 'SELECT phash_id, phash, radius, inner_id, inner_population, outer_id, outer_population FROM {} CROSS JOIN shape_perceptual_hashes USING ( phash_id ) CROSS JOIN shape_vptree USING ( phash_id );'.format( temp_table_name ) ).fetchall()
                     
                 
             
-            uncached_perceptual_hash_ids_to_vp_tree_nodes = { perceptual_hash_id : ( phash, radius, inner_id, outer_id ) for ( perceptual_hash_id, phash, radius, inner_id, outer_id ) in rows }
+            uncached_perceptual_hash_ids_to_vp_tree_nodes = { perceptual_hash_id : ( HydrusData.ConvertPerceptualHashToInt( phash ), radius, inner_id, inner_population, outer_id, outer_population ) for ( perceptual_hash_id, phash, radius, inner_id, inner_population, outer_id, outer_population ) in rows }
             
             if len( uncached_perceptual_hash_ids_to_vp_tree_nodes ) < len( uncached_perceptual_hash_ids ):
                 
@@ -586,6 +735,8 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             self._Execute( 'REPLACE INTO shape_search_cache ( hash_id, searched_distance ) VALUES ( ?, ? );', ( hash_id, None ) )
             
+            self._maintenance_due_cache = None
+            
         
         return perceptual_hash_ids
         
@@ -657,11 +808,13 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             job_status.SetStatusTitle( 'similar files metadata maintenance' )
             
-            rebalance_perceptual_hash_ids = self._STL( self._Execute( 'SELECT phash_id FROM shape_maintenance_branch_regen;' ) )
+            # we only ever need how many are left and which is the biggest, so let sqlite answer that rather than pulling the whole queue into python every loop
+            
+            ( num_to_do, ) = self._Execute( 'SELECT COUNT( * ) FROM shape_maintenance_branch_regen;' ).fetchone()
             
-            num_to_do = len( rebalance_perceptual_hash_ids )
+            num_left = num_to_do
             
-            while len( rebalance_perceptual_hash_ids ) > 0:
+            while num_left > 0:
                 
                 if pub_job_status and not job_status_pubbed and HydrusTime.TimeHasPassed( time_started + 5 ):
                     
@@ -679,7 +832,7 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
                     return
                     
                 
-                num_done = num_to_do - len( rebalance_perceptual_hash_ids )
+                num_done = num_to_do - num_left
                 
                 text = 'rebalancing similar file metadata - ' + HydrusData.ConvertValueRangeToPrettyString( num_done, num_to_do )
                 
@@ -687,26 +840,23 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
                 job_status.SetStatusText( text )
                 job_status.SetVariable( 'popup_gauge_1', ( num_done, num_to_do ) )
                 
-                with self._MakeTemporaryIntegerTable( rebalance_perceptual_hash_ids, 'phash_id' ) as temp_table_name:
+                # maintenance queue to tree
+                result = self._Execute( 'SELECT phash_id FROM shape_maintenance_branch_regen CROSS JOIN shape_vptree USING ( phash_id ) ORDER BY inner_population + outer_population DESC LIMIT 1;' ).fetchone()
+                
+                if result is None:
                     
-                    # temp perceptual hashes to tree
-                    result = self._Execute( 'SELECT phash_id FROM {} CROSS JOIN shape_vptree USING ( phash_id ) ORDER BY inner_population + outer_population DESC;'.format( temp_table_name ) ).fetchone()
+                    self._Execute( 'DELETE FROM shape_maintenance_branch_regen;' )
                     
-                    if result is None:
-                        
-                        self._Execute( 'DELETE FROM shape_maintenance_branch_regen;' )
-                        
-                        return
-                        
-                    else:
-                        
-                        ( biggest_perceptual_hash_id, ) = result
-                        
+                    return
+                    
+                else:
+                    
+                    ( biggest_perceptual_hash_id, ) = result
                     
                 
                 self._RegenerateBranch( job_status, biggest_perceptual_hash_id )
                 
-                rebalance_perceptual_hash_ids = self._STL( self._Execute( 'SELECT phash_id FROM shape_maintenance_branch_regen;' ) )
+                ( num_left, ) = self._Execute( 'SELECT COUNT( * ) FROM shape_maintenance_branch_regen;' ).fetchone()
                 
             
         finally:
@@ -727,13 +877,27 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             search_distance = new_options.GetInteger( 'similar_files_duplicate_pairs_search_distance' )
             
-            ( count, ) = self._Execute( 'SELECT COUNT( * ) FROM ( SELECT 1 FROM shape_search_cache WHERE searched_distance IS NULL or searched_distance < ? LIMIT 100 );', ( search_distance, ) ).fetchone()
+            # this is a scan of the search cache, so we remember the answer for a bit. adding or resetting files clears it
+            # searching files does not, so a stale answer here can only be a 'yes' that the search job will quickly find is done
             
-            if count >= 100:
+            if self._maintenance_due_cache is not None:
+                
+                ( cached_search_distance, cached_result, cached_time ) = self._maintenance_due_cache
                 
-                return True
+                if cached_search_distance == search_distance and not HydrusTime.TimeHasPassed( cached_time + 60 ):
+                    
+                    return cached_result
+                    
                 
             
+            ( count, ) = self._Execute( 'SELECT COUNT( * ) FROM ( SELECT 1 FROM shape_search_cache WHERE searched_distance IS NULL or searched_distance < ? LIMIT 100 );', ( search_distance, ) ).fetchone()
+            
+            result = count >= 100
+            
+            self._maintenance_due_cache = ( search_distance, result, HydrusTime.GetNow() )
+            
+            return result
+            
         
         return False
         
@@ -761,6 +925,8 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             self._perceptual_hash_id_to_vp_tree_node_cache = {}
             self._non_vp_treed_perceptual_hash_ids = set()
             self._root_node_perceptual_hash_id = None
+            self._perceptual_hash_id_to_vp_tree_bucket_cache = {}
+            self._perceptual_hashes_to_perceptual_hash_ids_cache = {}
             
             all_nodes = self._Execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ).fetchall()
             
@@ -770,6 +936,8 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             self._GenerateBranch( job_status, None, root_id, root_perceptual_hash, all_nodes )
             
+            self._root_node_perceptual_hash_id = root_id
+            
             self._Execute( 'DELETE FROM shape_maintenance_branch_regen;' )
             
         finally:
@@ -783,7 +951,12 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
     
     def ResetSearch( self, hash_ids ):
         
-        self._ExecuteMany( 'UPDATE shape_search_cache SET searched_distance = NULL WHERE hash_id = ?;', ( ( hash_id, ) for hash_id in hash_ids ) )
+        with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_hash_ids_table_name:
+            
+            self._Execute( f'UPDATE shape_search_cache SET searched_distance = NULL WHERE hash_id IN ( SELECT hash_id FROM {temp_hash_ids_table_name} );' )
+            
+        
+        self._maintenance_due_cache = None
         
     
     def SearchFile( self, hash_id: int, max_hamming_distance: int ) -> typing.List:
@@ -797,22 +970,22 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             similar_hash_ids_and_distances.extend( self.SearchPixelHashes( ( pixel_hash_id, ) ) )
             
         
+        perceptual_hash_ids = self._GetPerceptualHashIdsFromHashId( hash_id )
+        
         if max_hamming_distance == 0:
             
-            exact_match_hash_ids = self._STL( self._Execute( 'SELECT hash_id FROM shape_perceptual_hash_map WHERE phash_id IN ( SELECT phash_id FROM shape_perceptual_hash_map WHERE hash_id = ? );', ( hash_id, ) ) )
+            exact_match_hash_ids = self._GetHashIdsFromPerceptualHashIds( perceptual_hash_ids )
             
             similar_hash_ids_and_distances.extend( [ ( exact_match_hash_id, 0 ) for exact_match_hash_id in exact_match_hash_ids ] )
             
         else:
             
-            perceptual_hash_ids = self._GetPerceptualHashIdsFromHashId( hash_id )
-            
             perceptual_hashes = self._GetPerceptualHashes( perceptual_hash_ids )
             
             similar_hash_ids_and_distances.extend( self.SearchPerceptualHashes( perceptual_hashes, max_hamming_distance ) )
             
         
-        similar_hash_ids_and_distances = HydrusData.DedupeList( similar_hash_ids_and_distances )
+        similar_hash_ids_and_distances = DedupeHashIdsAndDistances( similar_hash_ids_and_distances )
         
         return similar_hash_ids_and_distances
         
@@ -828,7 +1001,7 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             similar_hash_ids_and_distances.extend( [ ( pixel_dupe_hash_id, 0 ) for pixel_dupe_hash_id in pixel_dupe_hash_ids ] )
             
         
-        similar_hash_ids_and_distances = HydrusData.DedupeList( similar_hash_ids_and_distances )
+        similar_hash_ids_and_distances = DedupeHashIdsAndDistances( similar_hash_ids_and_distances )
         
         return similar_hash_ids_and_distances
         
@@ -856,30 +1029,19 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
                     
                 
             
-            if len( perceptual_hash_ids ) > 0:
-                
-                with self._MakeTemporaryIntegerTable( perceptual_hash_ids, 'phash_id' ) as temp_table_name:
-                    
-                    similar_hash_ids = self._STL( self._Execute( f'SELECT hash_id FROM shape_perceptual_hash_map NATURAL JOIN {temp_table_name};' ) )
-                    
-                
-                similar_hash_ids_and_distances.extend( [ ( similar_hash_id, 0 ) for similar_hash_id in similar_hash_ids ] )
-                
+            similar_hash_ids = self._GetHashIdsFromPerceptualHashIds( perceptual_hash_ids )
+            
+            similar_hash_ids_and_distances.extend( [ ( similar_hash_id, 0 ) for similar_hash_id in similar_hash_ids ] )
             
         else:
             
             search_radius = max_hamming_distance
             
-            if self._root_node_perceptual_hash_id is None:
-                
-                top_node_result = self._Execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
-                
-                if top_node_result is None:
-                    
-                    return similar_hash_ids_and_distances
-                    
+            root_node_perceptual_hash_id = self._GetRootNodePerceptualHashId()
+            
+            if root_node_perceptual_hash_id is None:
                 
-                ( self._root_node_perceptual_hash_id, ) = top_node_result
+                return similar_hash_ids_and_distances
                 
             
             similar_perceptual_hash_ids_to_distances = {}
@@ -887,85 +1049,128 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             num_cycles = 0
             total_nodes_searched = 0
             
-            for search_perceptual_hash in search_perceptual_hashes:
+            # we walk the tree for all the search hashes at once, level by level, so each level's node fetch is shared
+            
+            # the caches hold perceptual hashes as ints, decoded once on fetch, so we decode our search hashes once here too
+            
+            next_potentials = [ ( HydrusData.ConvertPerceptualHashToInt( search_perceptual_hash ), root_node_perceptual_hash_id ) for search_perceptual_hash in search_perceptual_hashes ]
+            bucket_potentials = []
+            
+            while len( next_potentials ) > 0:
+                
+                current_potentials = next_potentials
+                next_potentials = []
+                
+                num_cycles += 1
+                total_nodes_searched += len( current_potentials )
+                
+                # this is no longer an iterable inside the main node SELECT because it was causing crashes on linux!!
+                # after investigation, it seemed to be SQLite having a problem with part of Get64BitHammingDistance touching perceptual_hashes it presumably was still hanging on to
+                # the crash was in sqlite code, again presumably on subsequent fetch
+                # adding a fake delay in seemed to fix it also. guess it was some memory maintenance buffer/bytes thing
+                # anyway, we now just get the whole lot of results first and then work on the whole lot
+                # UPDATE: we moved to a cache finally, so the iteration danger is less worrying, but leaving the above up anyway
                 
-                next_potentials = [ self._root_node_perceptual_hash_id ]
+                self._TryToPopulatePerceptualHashToVPTreeNodeCache( { node_perceptual_hash_id for ( search_perceptual_hash, node_perceptual_hash_id ) in current_potentials } )
                 
-                while len( next_potentials ) > 0:
+                for ( search_perceptual_hash, node_perceptual_hash_id ) in current_potentials:
                     
-                    current_potentials = next_potentials
-                    next_potentials = []
+                    if node_perceptual_hash_id not in self._perceptual_hash_id_to_vp_tree_node_cache:
+                        
+                        # something crazy happened, probably a broken tree branch, move on
+                        continue
+                        
                     
-                    num_cycles += 1
-                    total_nodes_searched += len( current_potentials )
+                    ( node_perceptual_hash, node_radius, inner_perceptual_hash_id, inner_population, outer_perceptual_hash_id, outer_population ) = self._perceptual_hash_id_to_vp_tree_node_cache[ node_perceptual_hash_id ]
                     
-                    # this is no longer an iterable inside the main node SELECT because it was causing crashes on linux!!
-                    # after investigation, it seemed to be SQLite having a problem with part of Get64BitHammingDistance touching perceptual_hashes it presumably was still hanging on to
-                    # the crash was in sqlite code, again presumably on subsequent fetch
-                    # adding a fake delay in seemed to fix it also. guess it was some memory maintenance buffer/bytes thing
-                    # anyway, we now just get the whole lot of results first and then work on the whole lot
-                    # UPDATE: we moved to a cache finally, so the iteration danger is less worrying, but leaving the above up anyway
+                    # first check the node itself--is it similar?
                     
-                    self._TryToPopulatePerceptualHashToVPTreeNodeCache( current_potentials )
+                    node_hamming_distance = HydrusData.Get64BitHammingDistanceFromInts( search_perceptual_hash, node_perceptual_hash )
                     
-                    for node_perceptual_hash_id in current_potentials:
+                    if node_hamming_distance <= search_radius:
                         
-                        if node_perceptual_hash_id not in self._perceptual_hash_id_to_vp_tree_node_cache:
+                        if node_perceptual_hash_id in similar_perceptual_hash_ids_to_distances:
                             
-                            # something crazy happened, probably a broken tree branch, move on
-                            continue
+                            current_distance = similar_perceptual_hash_ids_to_distances[ node_perceptual_hash_id ]
+                            
+                            similar_perceptual_hash_ids_to_distances[ node_perceptual_hash_id ] = min( node_hamming_distance, current_distance )
+                            
+                        else:
+                            
+                            similar_perceptual_hash_ids_to_distances[ node_perceptual_hash_id ] = node_hamming_distance
                             
                         
-                        ( node_perceptual_hash, node_radius, inner_perceptual_hash_id, outer_perceptual_hash_id ) = self._perceptual_hash_id_to_vp_tree_node_cache[ node_perceptual_hash_id ]
-                        
-                        # first check the node itself--is it similar?
+                    
+                    # now how about its children--where should we search next?
+                    
+                    if node_radius is not None:
                         
-                        node_hamming_distance = HydrusData.Get64BitHammingDistance( search_perceptual_hash, node_perceptual_hash )
+                        # we have two spheres--node and search--their centers separated by node_hamming_distance
+                        # we want to search inside/outside the node_sphere if the search_sphere intersects with those spaces
+                        # there are four possibles:
+                        # (----N----)-(--S--)    intersects with outer only - distance between N and S > their radii
+                        # (----N---(-)-S--)      intersects with both
+                        # (----N-(--S-)-)        intersects with both
+                        # (---(-N-S--)-)         intersects with inner only - distance between N and S + radius_S does not exceed radius_N
                         
-                        if node_hamming_distance <= search_radius:
+                        # the spheres intersect at some point, i.e. they are not disjoint
+                        if inner_perceptual_hash_id is not None and node_hamming_distance <= node_radius + search_radius:
                             
-                            if node_perceptual_hash_id in similar_perceptual_hash_ids_to_distances:
+                            if inner_population <= VP_TREE_BUCKET_POPULATION:
+                                
+                                bucket_potentials.append( ( search_perceptual_hash, inner_perceptual_hash_id ) )
+                                
+                            else:
                                 
-                                current_distance = similar_perceptual_hash_ids_to_distances[ node_perceptual_hash_id ]
+                                next_potentials.append( ( search_perceptual_hash, inner_perceptual_hash_id ) )
                                 
-                                similar_perceptual_hash_ids_to_distances[ node_perceptual_hash_id ] = min( node_hamming_distance, current_distance )
+                            
+                        
+                        # the search sphere intersects with non-node sphere space at some point, i.e. it is not a subset of the node sphere
+                        if outer_perceptual_hash_id is not None and node_hamming_distance + search_radius > node_radius:
+                            
+                            if outer_population <= VP_TREE_BUCKET_POPULATION:
+                                
+                                bucket_potentials.append( ( search_perceptual_hash, outer_perceptual_hash_id ) )
                                 
                             else:
                                 
-                                similar_perceptual_hash_ids_to_distances[ node_perceptual_hash_id ] = node_hamming_distance
+                                next_potentials.append( ( search_perceptual_hash, outer_perceptual_hash_id ) )
                                 
                             
                         
-                        # now how about its children--where should we search next?
+                    
+                
+            
+            # small subtrees we did not walk, we now fetch whole and scan
+            
+            if len( bucket_potentials ) > 0:
+                
+                self._TryToPopulatePerceptualHashToVPTreeBucketCache( { bucket_perceptual_hash_id for ( search_perceptual_hash, bucket_perceptual_hash_id ) in bucket_potentials } )
+                
+                for ( search_perceptual_hash, bucket_perceptual_hash_id ) in bucket_potentials:
+                    
+                    ( member_perceptual_hash_ids, member_perceptual_hashes ) = self._perceptual_hash_id_to_vp_tree_bucket_cache[ bucket_perceptual_hash_id ]
+                    
+                    total_nodes_searched += len( member_perceptual_hash_ids )
+                    
+                    member_hamming_distances = [ HydrusData.Get64BitHammingDistanceFromInts( search_perceptual_hash, member_perceptual_hash ) for member_perceptual_hash in member_perceptual_hashes ]
+                    
+                    for ( i, member_hamming_distance ) in enumerate( member_hamming_distances ):
                         
-                        if node_radius is not None:
+                        if member_hamming_distance <= search_radius:
                             
-                            # we have two spheres--node and search--their centers separated by node_hamming_distance
-                            # we want to search inside/outside the node_sphere if the search_sphere intersects with those spaces
-                            # there are four possibles:
-                            # (----N----)-(--S--)    intersects with outer only - distance between N and S > their radii
-                            # (----N---(-)-S--)      intersects with both
-                            # (----N-(--S-)-)        intersects with both
-                            # (---(-N-S--)-)         intersects with inner only - distance between N and S + radius_S does not exceed radius_N
+                            member_perceptual_hash_id = member_perceptual_hash_ids[ i ]
                             
-                            if inner_perceptual_hash_id is not None:
+                            if member_perceptual_hash_id in similar_perceptual_hash_ids_to_distances:
                                 
-                                spheres_disjoint = node_hamming_distance > ( node_radius + search_radius )
+                                current_distance = similar_perceptual_hash_ids_to_distances[ member_perceptual_hash_id ]
                                 
-                                if not spheres_disjoint: # i.e. they intersect at some point
-                                    
-                                    next_potentials.append( inner_perceptual_hash_id )
-                                    
+                                similar_perceptual_hash_ids_to_distances[ member_perceptual_hash_id ] = min( member_hamming_distance, current_distance )
                                 
-                            
-                            if outer_perceptual_hash_id is not None:
-                                
-                                search_sphere_subset_of_node_sphere = ( node_hamming_distance + search_radius ) <= node_radius
+                            else:
                                 
-                                if not search_sphere_subset_of_node_sphere: # i.e. search sphere intersects with non-node sphere space at some point
-                                    
-                                    next_potentials.append( outer_perceptual_hash_id )
-                                    
+                                similar_perceptual_hash_ids_to_distances[ member_perceptual_hash_id ] = member_hamming_distance
                                 
                             
                         
@@ -979,43 +1184,24 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             # so, now we have perceptual_hash_ids and distances. let's map that to actual files.
             # files can have multiple perceptual_hashes, and perceptual_hashes can refer to multiple files, so let's make sure we are setting the smallest distance we found
+            # sqlite can do that grouping for us in the join
             
-            similar_perceptual_hash_ids = list( similar_perceptual_hash_ids_to_distances.keys() )
+            self._Execute( 'CREATE TABLE IF NOT EXISTS mem.temp_phash_ids_and_distances ( phash_id INTEGER PRIMARY KEY, distance INTEGER );' )
             
-            with self._MakeTemporaryIntegerTable( similar_perceptual_hash_ids, 'phash_id' ) as temp_table_name:
+            try:
                 
-                # temp perceptual_hashes to hash map
-                similar_perceptual_hash_ids_to_hash_ids = HydrusData.BuildKeyToListDict( self._Execute( 'SELECT phash_id, hash_id FROM {} CROSS JOIN shape_perceptual_hash_map USING ( phash_id );'.format( temp_table_name ) ) )
+                self._ExecuteMany( 'INSERT INTO temp_phash_ids_and_distances ( phash_id, distance ) VALUES ( ?, ? );', similar_perceptual_hash_ids_to_distances.items() )
                 
-            
-            similar_hash_ids_to_distances = {}
-            
-            for ( perceptual_hash_id, hash_ids ) in similar_perceptual_hash_ids_to_hash_ids.items():
+                # temp perceptual_hashes to hash map
+                similar_hash_ids_and_distances.extend( self._Execute( 'SELECT hash_id, MIN( distance ) FROM temp_phash_ids_and_distances CROSS JOIN shape_perceptual_hash_map USING ( phash_id ) GROUP BY hash_id;' ).fetchall() )
                 
-                distance = similar_perceptual_hash_ids_to_distances[ perceptual_hash_id ]
+            finally:
                 
-                for hash_id in hash_ids:
-                    
-                    if hash_id not in similar_hash_ids_to_distances:
-                        
-                        similar_hash_ids_to_distances[ hash_id ] = distance
-                        
-                    else:
-                        
-                        current_distance = similar_hash_ids_to_distances[ hash_id ]
-                        
-                        if distance < current_distance:
-                            
-                            similar_hash_ids_to_distances[ hash_id ] = distance
-                            
-                        
-                    
+                self._Execute( 'DELETE FROM temp_phash_ids_and_distances;' )
                 
             
-            similar_hash_ids_and_distances.extend( similar_hash_ids_to_distances.items() )
-            
         
-        similar_hash_ids_and_distances = HydrusData.DedupeList( similar_hash_ids_and_distances )
+        similar_hash_ids_and_distances = DedupeHashIdsAndDistances( similar_hash_ids_and_distances )
         
         return similar_hash_ids_and_distances
         
@@ -1032,6 +1218,8 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             self._Execute( 'REPLACE INTO shape_search_cache ( hash_id, searched_distance ) VALUES ( ?, ? );', ( hash_id, None ) )
             
+            self._maintenance_due_cache = None
+            
         
     
     def SetPerceptualHashes( self, hash_id, perceptual_hashes ):
@@ -1057,4 +1245,6 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         
         self._Execute( 'DELETE FROM shape_search_cache WHERE hash_id = ?;', ( hash_id, ) )
         
+        self._maintenance_due_cache = None
+        
     
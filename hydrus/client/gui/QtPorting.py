@@ -11,8 +11,6 @@ from qtpy import QtGui as QG
 
 import math
 
-from collections import defaultdict
-
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusGlobals as HG
@@ -25,6 +23,9 @@ from hydrus.client.gui import QtInit
 
 isValid = QtInit.isValid
 
+# the page tab drag carries no data, just this format to say what it is
+PAGE_TAB_DRAG_MIMETYPE = 'application/hydrus-tab'
+
 def registerEventType():
     
     if QtInit.WE_ARE_PYSIDE:
@@ -43,7 +44,7 @@ class HBoxLayout( QW.QHBoxLayout ):
         
         QW.QHBoxLayout.__init__( self )
         
-        self.setMargin( margin )
+        self.setContentsMargins( margin, margin, margin, margin )
         self.setSpacing( spacing )
         
     
@@ -59,7 +60,7 @@ class VBoxLayout( QW.QVBoxLayout ):
         
         QW.QVBoxLayout.__init__( self )
         
-        self.setMargin( margin )
+        self.setContentsMargins( margin, margin, margin, margin )
         self.setSpacing( spacing )
         
 
@@ -95,14 +96,24 @@ class LabelledSlider( QW.QWidget ):
         self._value_label.setAlignment( QC.Qt.AlignVCenter | QC.Qt.AlignHCenter )
         self.layout().setAlignment( self._value_label, QC.Qt.AlignHCenter )
         
-        self._slider.valueChanged.connect( self._UpdateLabels )
+        # a drag fires valueChanged for every tick, so we only update the label once per event loop pass
+        self._value_label_update_timer = QC.QTimer( self )
+        self._value_label_update_timer.setSingleShot( True )
+        self._value_label_update_timer.setInterval( 0 )
+        self._value_label_update_timer.timeout.connect( self._UpdateValueLabel )
         
-        self._UpdateLabels()
+        self._slider.valueChanged.connect( lambda value: self._value_label_update_timer.start() )
         
-    def _UpdateLabels( self ):
+        self._UpdateRangeLabels()
+        self._UpdateValueLabel()
+        
+    def _UpdateRangeLabels( self ):
         
         self._min_label.setText( str( self._slider.minimum() ) )
         self._max_label.setText( str( self._slider.maximum() ) )
+        
+    def _UpdateValueLabel( self ):
+        
         self._value_label.setText( str( self._slider.value() ) )
         
     def GetValue( self ):
@@ -111,16 +122,15 @@ class LabelledSlider( QW.QWidget ):
     
     def SetRange( self, min, max ):
         
+        # if this clamps the value, valueChanged will schedule the value label update
         self._slider.setRange( min, max )
         
-        self._UpdateLabels()
+        self._UpdateRangeLabels()
         
     def SetValue( self, value ):
         
         self._slider.setValue( value )
         
-        self._UpdateLabels()
-        
 
 def SplitterVisibleCount( splitter ):
     
@@ -156,6 +166,12 @@ class DirPickerCtrl( QW.QWidget ):
         
         self.setLayout( layout )
         
+        # we don't want to hit the disk (maybe a slow network share) on every keystroke, so we wait for typing to settle
+        self._text_path_check_timer = QC.QTimer( self )
+        self._text_path_check_timer.setSingleShot( True )
+        self._text_path_check_timer.setInterval( 250 )
+        self._text_path_check_timer.timeout.connect( self._CheckTextPath )
+        
     
     def SetPath( self, path ):
         
@@ -196,13 +212,18 @@ class DirPickerCtrl( QW.QWidget ):
             
         
     
-    def _TextEdited( self, text ):
+    def _CheckTextPath( self ):
         
-        if os.path.exists( text ):
+        if os.path.exists( self._path_edit.text() ):
             
             self.dirPickerChanged.emit()
             
         
+    
+    def _TextEdited( self, text ):
+        
+        self._text_path_check_timer.start()
+        
 
 class FilePickerCtrl( QW.QWidget ):
     
@@ -233,6 +254,12 @@ class FilePickerCtrl( QW.QWidget ):
         
         self._starting_directory = starting_directory
         
+        # we don't want to hit the disk (maybe a slow network share) on every keystroke, so we wait for typing to settle
+        self._text_path_check_timer = QC.QTimer( self )
+        self._text_path_check_timer.setSingleShot( True )
+        self._text_path_check_timer.setInterval( 250 )
+        self._text_path_check_timer.timeout.connect( self._CheckTextPath )
+        
 
     def SetPath( self, path ):
         
@@ -304,12 +331,24 @@ class FilePickerCtrl( QW.QWidget ):
             
         
 
+    def _CheckTextPath( self ):
+        
+        if os.path.exists( self._path_edit.text() ):
+            
+            self.filePickerChanged.emit()
+            
+        
+    
     def _TextEdited( self, text ):
         
-        if self._save_mode or os.path.exists( text ):
+        if self._save_mode:
             
             self.filePickerChanged.emit()
             
+        else:
+            
+            self._text_path_check_timer.start()
+            
         
 
 class TabBar( QW.QTabBar ):
@@ -337,6 +376,35 @@ class TabBar( QW.QTabBar ):
         self._last_clicked_global_pos = None
         self._last_clicked_timestamp_ms = 0
         
+        # QTabBar makes its scroll buttons in its constructor, so we can grab them once here rather than hunting through children() every wheel tick
+        self._scroll_left_button = self.findChild( QW.QAbstractButton, 'ScrollLeftButton' )
+        self._scroll_right_button = self.findChild( QW.QAbstractButton, 'ScrollRightButton' )
+        
+        if self._scroll_left_button is None or self._scroll_right_button is None:
+            
+            children = self.children()
+            
+            if len( children ) >= 2 and isinstance( children[0], QW.QAbstractButton ) and isinstance( children[1], QW.QAbstractButton ):
+                
+                ( self._scroll_left_button, self._scroll_right_button ) = ( children[0], children[1] )
+                
+            
+        
+        self._UpdateDnDOptions()
+        
+        CG.client_controller.sub( self, '_UpdateDnDOptions', 'notify_new_options' )
+        
+    
+    def _UpdateDnDOptions( self ):
+        
+        # these are checked on every drag move and wheel event, so we cache them
+        
+        new_options = CG.client_controller.new_options
+        
+        self._page_drag_change_tab_normally = new_options.GetBoolean( 'page_drag_change_tab_normally' )
+        self._page_drag_change_tab_with_shift = new_options.GetBoolean( 'page_drag_change_tab_with_shift' )
+        self._wheel_scrolls_tab_bar = new_options.GetBoolean( 'wheel_scrolls_tab_bar' )
+        
     
     def AddSupplementaryTabBarDropTarget( self, drop_target ):
         
@@ -352,11 +420,6 @@ class TabBar( QW.QTabBar ):
         self._last_clicked_timestamp_ms = 0
         
     
-    def event( self, event ):
-        
-        return QW.QTabBar.event( self, event )
-        
-    
     def mouseMoveEvent( self, e ):
         
         e.ignore()
@@ -364,11 +427,9 @@ class TabBar( QW.QTabBar ):
     
     def mousePressEvent( self, event ):
         
-        index = self.tabAt( event.position().toPoint() )
-        
         if event.button() == QC.Qt.LeftButton:
             
-            self._last_clicked_tab_index = index
+            self._last_clicked_tab_index = self.tabAt( event.position().toPoint() )
             
             self._last_clicked_global_pos = event.globalPosition().toPoint()
             
@@ -380,10 +441,10 @@ class TabBar( QW.QTabBar ):
     
     def mouseReleaseEvent( self, event ):
         
-        index = self.tabAt( event.position().toPoint() )
-        
         if event.button() == QC.Qt.MiddleButton:
             
+            index = self.tabAt( event.position().toPoint() )
+            
             if index != -1:
                 
                 self.tabMiddleClicked.emit( index )
@@ -431,7 +492,7 @@ class TabBar( QW.QTabBar ):
     
     def dragEnterEvent(self, event):
 
-        if 'application/hydrus-tab' in event.mimeData().formats():
+        if event.mimeData().hasFormat( PAGE_TAB_DRAG_MIMETYPE ):
             
             event.ignore()
             
@@ -443,7 +504,7 @@ class TabBar( QW.QTabBar ):
     
     def dragMoveEvent( self, event ):
         
-        if 'application/hydrus-tab' not in event.mimeData().formats():
+        if not event.mimeData().hasFormat( PAGE_TAB_DRAG_MIMETYPE ):
             
             tab_index = self.tabAt( event.position().toPoint() )
             
@@ -453,11 +514,11 @@ class TabBar( QW.QTabBar ):
                 
                 if shift_down:
                     
-                    do_navigate = CG.client_controller.new_options.GetBoolean( 'page_drag_change_tab_with_shift' )
+                    do_navigate = self._page_drag_change_tab_with_shift
                     
                 else:
                     
-                    do_navigate = CG.client_controller.new_options.GetBoolean( 'page_drag_change_tab_normally' )
+                    do_navigate = self._page_drag_change_tab_normally
                     
                 
                 if do_navigate:
@@ -493,28 +554,20 @@ class TabBar( QW.QTabBar ):
         
         try:
             
-            if CG.client_controller.new_options.GetBoolean( 'wheel_scrolls_tab_bar' ):
+            if self._wheel_scrolls_tab_bar:
                 
-                children = self.children()
-                
-                if len( children ) >= 2:
+                if event.angleDelta().y() > 0:
                     
-                    scroll_left = children[0]
-                    scroll_right = children[1]
+                    b = self._scroll_left_button
                     
-                    if event.angleDelta().y() > 0:
-                        
-                        b = scroll_left
-                        
-                    else:
-                        
-                        b = scroll_right
-                        
+                else:
                     
-                    if isinstance( b, QW.QAbstractButton ):
-                        
-                        b.click()
-                        
+                    b = self._scroll_right_button
+                    
+                
+                if b is not None:
+                    
+                    b.click()
                     
                 
                 event.accept()
@@ -548,52 +601,36 @@ class TabWidgetWithDnD( QW.QTabWidget ):
         
         self._supplementary_drop_target = None
         
+        self._UpdateDnDOptions()
+        
+        CG.client_controller.sub( self, '_UpdateDnDOptions', 'notify_new_options' )
+        
     
-    def _LayoutPagesHelper( self ):
+    def _UpdateDnDOptions( self ):
         
-        current_index = self.currentIndex()
-
-        for i in range( self.count() ):
-
-            self.setCurrentIndex( i )
-
-            if isinstance( self.widget( i ), TabWidgetWithDnD ):
-                
-                self.widget( i )._LayoutPagesHelper()
-                
-            
+        # these are checked on every mouse move and drag move event, so we cache them
+        
+        new_options = CG.client_controller.new_options
         
-        self.setCurrentIndex( current_index )
+        self._disable_page_tab_dnd = new_options.GetBoolean( 'disable_page_tab_dnd' )
+        self._page_drag_change_tab_normally = new_options.GetBoolean( 'page_drag_change_tab_normally' )
+        self._page_drag_change_tab_with_shift = new_options.GetBoolean( 'page_drag_change_tab_with_shift' )
+        self._page_drop_chase_normally = new_options.GetBoolean( 'page_drop_chase_normally' )
+        self._page_drop_chase_with_shift = new_options.GetBoolean( 'page_drop_chase_with_shift' )
         
     
-    def LayoutPages( self ):
+    def _PosIsOverCurrentPage( self, pos: QC.QPoint ):
         
-        # hydev adds: I no longer call this, as I moved splitter setting to a thing called per page when page is first visibly shown
-        # leaving it here for now in case I need it again
+        # the page is a descendant of us, so we can map straight down rather than going via global coords
         
-        # Momentarily switch to each page, then back, forcing a layout update.
-        # If this is not done, the splitters on the hidden pages won't resize their widgets properly when we restore
-        # splitter sizes after this, since they would never became visible.
-        # We first have to climb up the widget hierarchy and go down recursively from the root tab widget,
-        # since it's not enough to make a page visible if its a nested page: all of its ancestor pages have to be visible too.
-        # This shouldn't be visible to users since we switch back immediately.
-        # There is probably a proper way to do this...
-
-        highest_ancestor_of_same_type = self
-
-        parent = self.parentWidget()
-
-        while parent is not None:
-
-            if isinstance( parent, TabWidgetWithDnD ):
-                
-                highest_ancestor_of_same_type = parent
-                
-
-            parent = parent.parentWidget()
+        current_widget = self.currentWidget()
+        
+        if current_widget is None:
+            
+            return False
             
         
-        highest_ancestor_of_same_type._LayoutPagesHelper() # This does the actual recursive descent and making pages visible
+        return current_widget.rect().contains( current_widget.mapFrom( self, pos ) )
         
     
     # This is a hack that adds an additional drop target to the tab bar. The added drop target will get drop events from the tab bar.
@@ -606,9 +643,9 @@ class TabWidgetWithDnD( QW.QTabWidget ):
     
     def mouseMoveEvent( self, e ):
         
-        mouse_is_over_actual_page = self.currentWidget() and self.currentWidget().rect().contains( self.currentWidget().mapFromGlobal( self.mapToGlobal( e.position().toPoint() ) ) )
+        my_mouse_pos = e.position().toPoint()
         
-        if mouse_is_over_actual_page or CG.client_controller.new_options.GetBoolean( 'disable_page_tab_dnd' ):
+        if self._PosIsOverCurrentPage( my_mouse_pos ) or self._disable_page_tab_dnd:
             
             QW.QTabWidget.mouseMoveEvent( self, e )
             
@@ -620,9 +657,7 @@ class TabWidgetWithDnD( QW.QTabWidget ):
             return
             
         
-        my_mouse_pos = e.position().toPoint()
-        global_mouse_pos = self.mapToGlobal( my_mouse_pos )
-        tab_bar_mouse_pos = self._tab_bar.mapFromGlobal( global_mouse_pos )
+        tab_bar_mouse_pos = self._tab_bar.mapFrom( self, my_mouse_pos )
         
         if not self._tab_bar.rect().contains( tab_bar_mouse_pos ):
             
@@ -654,11 +689,12 @@ class TabWidgetWithDnD( QW.QTabWidget ):
         tab_rect = self._tab_bar.tabRect( clicked_tab_index )
         
         pixmap = QG.QPixmap( tab_rect.size() )
+        pixmap.fill( QC.Qt.transparent ) # a new QPixmap is uninitialised, so any unpainted corners would be garbage
         self._tab_bar.render( pixmap, QC.QPoint(), QG.QRegion( tab_rect ) )
         
         mimeData = QC.QMimeData()
         
-        mimeData.setData( 'application/hydrus-tab', b'' )
+        mimeData.setData( PAGE_TAB_DRAG_MIMETYPE, QC.QByteArray() )
         
         drag = QG.QDrag( self._tab_bar )
         
@@ -680,12 +716,12 @@ class TabWidgetWithDnD( QW.QTabWidget ):
 
     def dragEnterEvent( self, e: QG.QDragEnterEvent ):
         
-        if self.currentWidget() and self.currentWidget().rect().contains( self.currentWidget().mapFromGlobal( self.mapToGlobal( e.position().toPoint() ) ) ):
+        if self._PosIsOverCurrentPage( e.position().toPoint() ):
             
             return QW.QTabWidget.dragEnterEvent( self, e )
             
         
-        if 'application/hydrus-tab' in e.mimeData().formats():
+        if e.mimeData().hasFormat( PAGE_TAB_DRAG_MIMETYPE ):
             
             e.accept()
             
@@ -699,9 +735,7 @@ class TabWidgetWithDnD( QW.QTabWidget ):
         
         #if self.currentWidget() and self.currentWidget().rect().contains( self.currentWidget().mapFromGlobal( self.mapToGlobal( event.position().toPoint() ) ) ): return QW.QTabWidget.dragMoveEvent( self, event )
         
-        screen_pos = self.mapToGlobal( event.position().toPoint() )
-        
-        tab_pos = self._tab_bar.mapFromGlobal( screen_pos )
+        tab_pos = self._tab_bar.mapFrom( self, event.position().toPoint() )
         
         tab_index = self._tab_bar.tabAt( tab_pos )
         
@@ -711,11 +745,11 @@ class TabWidgetWithDnD( QW.QTabWidget ):
             
             if shift_down:
                 
-                do_navigate = CG.client_controller.new_options.GetBoolean( 'page_drag_change_tab_with_shift' )
+                do_navigate = self._page_drag_change_tab_with_shift
                 
             else:
                 
-                do_navigate = CG.client_controller.new_options.GetBoolean( 'page_drag_change_tab_normally' )
+                do_navigate = self._page_drag_change_tab_normally
                 
             
             if do_navigate:
@@ -724,7 +758,7 @@ class TabWidgetWithDnD( QW.QTabWidget ):
                 
             
         
-        if 'application/hydrus-tab' not in event.mimeData().formats():
+        if not event.mimeData().hasFormat( PAGE_TAB_DRAG_MIMETYPE ):
             
             event.reject()
             
@@ -761,20 +795,18 @@ class TabWidgetWithDnD( QW.QTabWidget ):
     
     def dropEvent( self, e: QG.QDropEvent ):
         
-        if self.currentWidget() and self.currentWidget().rect().contains( self.currentWidget().mapFromGlobal( self.mapToGlobal( e.position().toPoint() ) ) ):
+        if self._PosIsOverCurrentPage( e.position().toPoint() ):
             
             return QW.QTabWidget.dropEvent( self, e )
             
         
-        if 'application/hydrus-tab' not in e.mimeData().formats(): #Page dnd has no associated mime data
+        if not e.mimeData().hasFormat( PAGE_TAB_DRAG_MIMETYPE ): #Page dnd has no associated mime data
             
             e.ignore()
             
             return
             
         
-        w = self
-        
         source_tab_bar = e.source()
         
         if not isinstance( source_tab_bar, TabBar ):
@@ -790,16 +822,11 @@ class TabWidgetWithDnD( QW.QTabWidget ):
         source_page = source_notebook.widget( source_page_index )
         source_name = source_tab_bar.tabText( source_page_index )
         
-        while w is not None:
+        if source_page == self or source_page.isAncestorOf( self ):
             
-            if source_page == w:
-                
-                # you cannot drop a page of pages inside itself
-                
-                return
-                
+            # you cannot drop a page of pages inside itself
             
-            w = w.parentWidget()
+            return
             
 
         e.setDropAction( QC.Qt.MoveAction )
@@ -808,9 +835,7 @@ class TabWidgetWithDnD( QW.QTabWidget ):
         
         counter = self.count()
         
-        screen_pos = self.mapToGlobal( e.position().toPoint() )
-        
-        tab_pos = self.tabBar().mapFromGlobal( screen_pos )
+        tab_pos = self.tabBar().mapFrom( self, e.position().toPoint() )
         
         dropped_on_tab_index = self.tabBar().tabAt( tab_pos )
         
@@ -828,15 +853,11 @@ class TabWidgetWithDnD( QW.QTabWidget ):
             
             tab_rect = self.tabBar().tabRect( dropped_on_tab_index )
             
-            edge_size = QC.QSize( EDGE_PADDING, tab_rect.height() )
-            
-            left_edge_rect = QC.QRect( tab_rect.topLeft(), edge_size )
-            right_edge_rect = QC.QRect( tab_rect.topRight() - QC.QPoint( EDGE_PADDING, 0 ), edge_size )
+            # tabAt already told us we are inside this tab, so we only need to check x
+            drop_x = tab_pos.x()
             
-            drop_pos = e.position().toPoint()
-            
-            dropped_on_left_edge = left_edge_rect.contains( drop_pos )
-            dropped_on_right_edge = right_edge_rect.contains( drop_pos )
+            dropped_on_left_edge = tab_rect.left() <= drop_x < tab_rect.left() + EDGE_PADDING
+            dropped_on_right_edge = tab_rect.right() - EDGE_PADDING <= drop_x < tab_rect.right()
             
         
         if counter == 0:
@@ -882,17 +903,13 @@ class TabWidgetWithDnD( QW.QTabWidget ):
 
             shift_down = e.modifiers() & QC.Qt.ShiftModifier
             
-            follow_dropped_page = not shift_down
-
-            new_options = CG.client_controller.new_options
-            
             if shift_down:
                 
-                follow_dropped_page = new_options.GetBoolean( 'page_drop_chase_with_shift' )
+                follow_dropped_page = self._page_drop_chase_with_shift
                 
             else:
                 
-                follow_dropped_page = new_options.GetBoolean( 'page_drop_chase_normally' )
+                follow_dropped_page = self._page_drop_chase_normally
                 
             
             if follow_dropped_page:
@@ -921,67 +938,76 @@ class TabWidgetWithDnD( QW.QTabWidget ):
     
 def DeleteAllNotebookPages( notebook ):
     
-    while notebook.count() > 0:
+    # removing from the end means the current page doesn't shift onto the next one (and show it) with every removal
+    notebook.setUpdatesEnabled( False )
+    
+    try:
         
-        tab = notebook.widget( 0 )
+        while notebook.count() > 0:
+            
+            index = notebook.count() - 1
+            
+            tab = notebook.widget( index )
+            
+            notebook.removeTab( index )
+            
+            tab.deleteLater()
+            
         
-        notebook.removeTab( 0 )
+    finally:
         
-        tab.deleteLater()
+        notebook.setUpdatesEnabled( True )
         
     
-def SplitVertically( splitter: QW.QSplitter, w1, w2, hpos ):
-
-    splitter.setOrientation( QC.Qt.Horizontal )
-
-    if w1.parentWidget() != splitter:
-        
-        splitter.addWidget( w1 )
-
-    w1.setVisible( True )
-
-    if w2.parentWidget() != splitter:
-        
-        splitter.addWidget( w2 )
-
-    w2.setVisible( True )
-
-    total_sum = sum( splitter.sizes() )
-
-    if hpos < 0:
-
-        splitter.setSizes( [ total_sum + hpos, -hpos ] )
-
-    elif hpos > 0:
-        
-        splitter.setSizes( [ hpos, total_sum - hpos ] )
 
-
-def SplitHorizontally( splitter: QW.QSplitter, w1, w2, vpos ):
+def _SplitInTwo( splitter: QW.QSplitter, orientation, w1, w2, pos ):
     
-    splitter.setOrientation( QC.Qt.Vertical )
+    # don't paint the intermediate states while we add/show widgets and shuffle sizes
+    splitter.setUpdatesEnabled( False )
     
-    if w1.parentWidget() != splitter:
+    try:
         
-        splitter.addWidget( w1 )
+        splitter.setOrientation( orientation )
         
-    w1.setVisible( True )
+        for w in ( w1, w2 ):
+            
+            if w.parentWidget() != splitter:
+                
+                splitter.addWidget( w )
+                
+            
+            w.setVisible( True )
+            
         
-    if w2.parentWidget() != splitter:
+        if pos != 0:
+            
+            total_sum = sum( splitter.sizes() )
+            
+            if pos < 0:
+                
+                splitter.setSizes( [ total_sum + pos, -pos ] )
+                
+            else:
+                
+                splitter.setSizes( [ pos, total_sum - pos ] )
+                
+            
+        
+    finally:
         
-        splitter.addWidget( w2 )
+        splitter.setUpdatesEnabled( True )
+        
+    
 
-    w2.setVisible( True )
+def SplitVertically( splitter: QW.QSplitter, w1, w2, hpos ):
     
-    total_sum = sum( splitter.sizes() )
+    _SplitInTwo( splitter, QC.Qt.Horizontal, w1, w2, hpos )
+    
+
+def SplitHorizontally( splitter: QW.QSplitter, w1, w2, vpos ):
+    
+    _SplitInTwo( splitter, QC.Qt.Vertical, w1, w2, vpos )
     
-    if vpos < 0:
-        
-        splitter.setSizes( [ total_sum + vpos, -vpos ] )
-        
-    elif vpos > 0:
-        
-        splitter.setSizes( [ vpos, total_sum - vpos ] )
 
 class GridLayout( QW.QGridLayout ):
     
@@ -990,7 +1016,7 @@ class GridLayout( QW.QGridLayout ):
         QW.QGridLayout.__init__( self )
         
         self._col_count = cols
-        self.setMargin( 2 )
+        self.setContentsMargins( 2, 2, 2, 2 )
         self.setSpacing( spacing )
         
         self.next_row = 0
@@ -1007,6 +1033,36 @@ class GridLayout( QW.QGridLayout ):
         self.setContentsMargins( val, val, val, val )
         
     
+# precomputed so AddToLayout, which runs for every widget in every window, can look its flag up rather than testing it against a ladder of tuples
+ADD_TO_LAYOUT_SIZER_FLAGS = { CC.FLAGS_EXPAND_SIZER_PERPENDICULAR, CC.FLAGS_EXPAND_SIZER_BOTH_WAYS }
+
+ADD_TO_LAYOUT_FIXED_ALIGNMENTS = {
+    CC.FLAGS_CENTER : QC.Qt.AlignVCenter | QC.Qt.AlignHCenter,
+    CC.FLAGS_ON_LEFT : QC.Qt.AlignLeft | QC.Qt.AlignVCenter,
+    CC.FLAGS_ON_RIGHT : QC.Qt.AlignRight | QC.Qt.AlignVCenter
+}
+
+# the 'perpendicular' flags depend on the layout's orientation, so each orientation gets its own fully resolved table
+ADD_TO_LAYOUT_HBOX_ALIGNMENTS = dict( ADD_TO_LAYOUT_FIXED_ALIGNMENTS )
+ADD_TO_LAYOUT_HBOX_ALIGNMENTS[ CC.FLAGS_CENTER_PERPENDICULAR ] = QC.Qt.AlignVCenter
+ADD_TO_LAYOUT_HBOX_ALIGNMENTS[ CC.FLAGS_CENTER_PERPENDICULAR_EXPAND_DEPTH ] = QC.Qt.AlignVCenter
+
+ADD_TO_LAYOUT_OTHER_ALIGNMENTS = dict( ADD_TO_LAYOUT_FIXED_ALIGNMENTS )
+ADD_TO_LAYOUT_OTHER_ALIGNMENTS[ CC.FLAGS_CENTER_PERPENDICULAR ] = QC.Qt.AlignHCenter
+ADD_TO_LAYOUT_OTHER_ALIGNMENTS[ CC.FLAGS_CENTER_PERPENDICULAR_EXPAND_DEPTH ] = QC.Qt.AlignHCenter
+
+# QSizePolicy is a small value type that setSizePolicy copies, so we can share these
+ADD_TO_LAYOUT_HBOX_PERPENDICULAR_SIZE_POLICY = QW.QSizePolicy( QW.QSizePolicy.Fixed, QW.QSizePolicy.Expanding )
+ADD_TO_LAYOUT_OTHER_PERPENDICULAR_SIZE_POLICY = QW.QSizePolicy( QW.QSizePolicy.Expanding, QW.QSizePolicy.Fixed )
+ADD_TO_LAYOUT_BOTH_WAYS_SIZE_POLICY = QW.QSizePolicy( QW.QSizePolicy.Expanding, QW.QSizePolicy.Expanding )
+
+ADD_TO_LAYOUT_BOTH_WAYS_STRETCH_FACTORS = {
+    CC.FLAGS_EXPAND_BOTH_WAYS : 50,
+    CC.FLAGS_EXPAND_SIZER_BOTH_WAYS : 50,
+    CC.FLAGS_EXPAND_BOTH_WAYS_POLITE : 30,
+    CC.FLAGS_EXPAND_BOTH_WAYS_SHY : 10
+}
+
 def AddToLayout( layout, item, flag = None, alignment = None ):
 
     if isinstance( layout, GridLayout ):
@@ -1027,9 +1083,9 @@ def AddToLayout( layout, item, flag = None, alignment = None ):
                 
             elif isinstance( item, tuple ):
                 
-                spacer = QW.QPushButton()#QW.QSpacerItem( 0, 0, QW.QSizePolicy.Expanding, QW.QSizePolicy.Fixed )
-                layout.addWidget( spacer, row, col )
-                spacer.setVisible(False)
+                # an expanding spacer here steals width from the real columns, but a fixed empty one lays out just like a hidden widget
+                spacer = QW.QSpacerItem( 0, 0, QW.QSizePolicy.Fixed, QW.QSizePolicy.Fixed )
+                layout.addItem( spacer, row, col )
                 
                 return
                 
@@ -1075,43 +1131,25 @@ def AddToLayout( layout, item, flag = None, alignment = None ):
             
         
     
-    zero_border = False
-    
     if flag is None or flag == CC.FLAGS_NONE:
         
-        pass
-        
-    elif flag in ( CC.FLAGS_CENTER, CC.FLAGS_ON_LEFT, CC.FLAGS_ON_RIGHT, CC.FLAGS_CENTER_PERPENDICULAR, CC.FLAGS_CENTER_PERPENDICULAR_EXPAND_DEPTH ):
+        return
         
-        if flag == CC.FLAGS_CENTER:
-            
-            alignment = QC.Qt.AlignVCenter | QC.Qt.AlignHCenter
-            
-        if flag == CC.FLAGS_ON_LEFT:
-            
-            alignment = QC.Qt.AlignLeft | QC.Qt.AlignVCenter
-            
-        elif flag == CC.FLAGS_ON_RIGHT:
-            
-            alignment = QC.Qt.AlignRight | QC.Qt.AlignVCenter
-            
-        elif flag in ( CC.FLAGS_CENTER_PERPENDICULAR, CC.FLAGS_CENTER_PERPENDICULAR_EXPAND_DEPTH ):
-            
-            if isinstance( layout, QW.QHBoxLayout ):
-                
-                alignment = QC.Qt.AlignVCenter
-                
-            else:
-                
-                alignment = QC.Qt.AlignHCenter
-                
-            
+    
+    zero_border = flag in ADD_TO_LAYOUT_SIZER_FLAGS
+    
+    layout_is_hbox = isinstance( layout, QW.QHBoxLayout )
+    layout_is_box = layout_is_hbox or isinstance( layout, QW.QVBoxLayout )
+    
+    alignments = ADD_TO_LAYOUT_HBOX_ALIGNMENTS if layout_is_hbox else ADD_TO_LAYOUT_OTHER_ALIGNMENTS
+    
+    if flag in alignments:
         
-        layout.setAlignment( item, alignment )
+        layout.setAlignment( item, alignments[ flag ] )
         
         if flag == CC.FLAGS_CENTER_PERPENDICULAR_EXPAND_DEPTH:
             
-            if isinstance( layout, QW.QVBoxLayout ) or isinstance( layout, QW.QHBoxLayout ):
+            if layout_is_box:
                 
                 layout.setStretchFactor( item, 5 )
                 
@@ -1124,55 +1162,21 @@ def AddToLayout( layout, item, flag = None, alignment = None ):
         
     elif flag in ( CC.FLAGS_EXPAND_PERPENDICULAR, CC.FLAGS_EXPAND_SIZER_PERPENDICULAR ):
         
-        if flag == CC.FLAGS_EXPAND_SIZER_PERPENDICULAR:
-            
-            zero_border = True
-            
-        
         if isinstance( item, QW.QWidget ):
             
-            if isinstance( layout, QW.QHBoxLayout ):
-                
-                h_policy = QW.QSizePolicy.Fixed
-                v_policy = QW.QSizePolicy.Expanding
-                
-            else:
-                
-                h_policy = QW.QSizePolicy.Expanding
-                v_policy = QW.QSizePolicy.Fixed
-                
-            
-            item.setSizePolicy( h_policy, v_policy )
+            item.setSizePolicy( ADD_TO_LAYOUT_HBOX_PERPENDICULAR_SIZE_POLICY if layout_is_hbox else ADD_TO_LAYOUT_OTHER_PERPENDICULAR_SIZE_POLICY )
             
         
-    elif flag in ( CC.FLAGS_EXPAND_BOTH_WAYS, CC.FLAGS_EXPAND_SIZER_BOTH_WAYS, CC.FLAGS_EXPAND_BOTH_WAYS_POLITE, CC.FLAGS_EXPAND_BOTH_WAYS_SHY ):
-        
-        if flag == CC.FLAGS_EXPAND_SIZER_BOTH_WAYS:
-            
-            zero_border = True
-            
+    elif flag in ADD_TO_LAYOUT_BOTH_WAYS_STRETCH_FACTORS:
         
         if isinstance( item, QW.QWidget ):
             
-            item.setSizePolicy( QW.QSizePolicy.Expanding, QW.QSizePolicy.Expanding )
+            item.setSizePolicy( ADD_TO_LAYOUT_BOTH_WAYS_SIZE_POLICY )
             
         
-        if isinstance( layout, QW.QVBoxLayout ) or isinstance( layout, QW.QHBoxLayout ):
+        if layout_is_box:
             
-            if flag in ( CC.FLAGS_EXPAND_BOTH_WAYS, CC.FLAGS_EXPAND_SIZER_BOTH_WAYS ):
-                
-                stretch_factor = 50
-                
-            elif flag == CC.FLAGS_EXPAND_BOTH_WAYS_POLITE:
-                
-                stretch_factor = 30
-                
-            elif flag == CC.FLAGS_EXPAND_BOTH_WAYS_SHY:
-                
-                stretch_factor = 10
-                
-            
-            layout.setStretchFactor( item, stretch_factor )
+            layout.setStretchFactor( item, ADD_TO_LAYOUT_BOTH_WAYS_STRETCH_FACTORS[ flag ] )
             
         
     
@@ -1223,6 +1227,8 @@ def AdjustOpacity( image: QG.QImage, opacity_factor ):
     
     painter.drawImage( 0, 0, image )
     
+    painter.end()
+    
     return new_image
     
 
@@ -1335,36 +1341,38 @@ class CallAfterEventCatcher( QC.QObject ):
 
 def CallAfter( fn, *args, **kwargs ):
     
-    QW.QApplication.instance().postEvent( QW.QApplication.instance().call_after_catcher, CallAfterEvent( fn, *args, **kwargs ) )
+    # this is called from worker threads, so it has to post to the catcher, which lives in the Qt thread. a QTimer.singleShot would fire in the calling thread's (absent) event loop
+    app = QW.QApplication.instance()
     
-    QW.QApplication.instance().eventDispatcher().wakeUp()
+    app.postEvent( app.call_after_catcher, CallAfterEvent( fn, *args, **kwargs ) )
+    
+    app.eventDispatcher().wakeUp()
     
 def ClearLayout( layout, delete_widgets = False ):
     
+    # taking from the end is cheap, taking from the front shuffles the whole item list every time
     while layout.count() > 0:
-
-        item = layout.itemAt( 0 )
-
+        
+        item = layout.takeAt( layout.count() - 1 )
+        
         if delete_widgets:
-
-            if item.widget():
-
-                item.widget().deleteLater()
-
-            elif item.layout():
-
-                ClearLayout( item.layout(), delete_widgets = True )
-                item.layout().deleteLater()
-
-            else:
-
-                spacer = item.layout().spacerItem()
-
-                del spacer
-
-        layout.removeItem( item )
+            
+            widget = item.widget()
+            child_layout = item.layout()
+            
+            if widget is not None:
+                
+                widget.deleteLater()
+                
+            elif child_layout is not None:
+                
+                ClearLayout( child_layout, delete_widgets = True )
+                child_layout.deleteLater()
+                
+            
         
     
+
 def GetClientData( widget, idx ):
     
     if isinstance( widget, QW.QComboBox ):
@@ -1413,22 +1421,24 @@ def ListWidgetDelete( widget, idx ):
 
 def ListWidgetGetSelection( widget ):
     
-    for i in range( widget.count() ):
-
-        if widget.item( i ).isSelected(): return i
-
-    return -1
+    # the selection model already knows what is selected, no need to ask every row
+    selected_indices = widget.selectionModel().selectedIndexes()
+    
+    if len( selected_indices ) == 0:
+        
+        return -1
+        
+    
+    return min( ( index.row() for index in selected_indices ) )
+    
 
 
 def ListWidgetGetStrings( widget ):
     
-    strings = []
+    item = widget.item
+    
+    return [ item( i ).text() for i in range( widget.count() ) ]
     
-    for i in range( widget.count() ):
-        
-        strings.append( widget.item( i ).text() )
-        
-    return strings
 
 
 def ListWidgetIsSelected( widget, idx ):
@@ -1449,14 +1459,26 @@ def ListWidgetSetSelection( widget, idxs ):
     
     count = widget.count()
     
+    model = widget.model()
+    
+    # one select call, rather than a selectionChanged for every row
+    selection = QC.QItemSelection()
+    
     for idx in idxs:
         
         if 0 <= idx <= count -1:
             
-            widget.item( idx ).setSelected( True )
+            index = model.index( idx, 0 )
+            
+            selection.select( index, index )
             
         
     
+    if not selection.isEmpty():
+        
+        widget.selectionModel().select( selection, QC.QItemSelectionModel.Select )
+        
+    
 def SetInitialSize( widget, size ):
     
     if hasattr( widget, 'SetInitialSize' ):
@@ -1485,21 +1507,25 @@ def SetBackgroundColour( widget, colour ):
 
         widget.setObjectName( object_name )
     
-    if isinstance( colour, QG.QColor ):
+    if isinstance( colour, tuple ):
         
-        widget.setStyleSheet( '#{} {{ background-color: {} }}'.format( object_name, colour.name()) )
+        colour = QG.QColor( *colour )
         
-    elif isinstance( colour, tuple ):
+    elif not isinstance( colour, QG.QColor ):
         
-        colour = QG.QColor( *colour )
+        colour = QG.QColor( colour )
         
-        widget.setStyleSheet( '#{} {{ background-color: {} }}'.format( object_name, colour.name() ) )
+    
+    # we stick with a stylesheet, not the palette, since a QSS theme would override a palette colour
+    style_sheet = '#{} {{ background-color: {} }}'.format( object_name, colour.name() )
+    
+    # setting a stylesheet repolishes the widget and all its children, so don't do it for no change
+    if widget.styleSheet() != style_sheet:
         
-    else:
-
-        widget.setStyleSheet( '#{} {{ background-color: {} }}'.format( object_name, QG.QColor( colour ).name() ) )
+        widget.setStyleSheet( style_sheet )
         
     
+
 def SetStringSelection( combobox, string ):
     
     index = combobox.findText( string )
@@ -1555,6 +1581,10 @@ class StatusBar( QW.QStatusBar ):
         
         self._labels = []
         
+        # we remember what we set so the frequent no-change updates don't have to ask qt
+        self._label_texts = [ '' for w in status_widths ]
+        self._label_tooltips = [ '' for w in status_widths ]
+        
         for w in status_widths:
             
             label = QW.QLabel()
@@ -1583,15 +1613,19 @@ class StatusBar( QW.QStatusBar ):
         
         cell = self._labels[ index ]
         
-        if cell.text() != text:
+        if self._label_texts[ index ] != text:
             
             cell.setText( text )
             
+            self._label_texts[ index ] = text
+            
         
-        if cell.toolTip() != tooltip:
+        if self._label_tooltips[ index ] != tooltip:
             
             cell.setToolTip( tooltip )
             
+            self._label_tooltips[ index ] = tooltip
+            
         
     
 class UIActionSimulator:
@@ -1636,12 +1670,17 @@ class RadioBox( QW.QFrame ):
         
         self._choices = []
         
-        for choice in choices:
+        # the group tracks which button is checked for us, so we can ask it rather than polling every button
+        self._button_group = QW.QButtonGroup( self )
+        
+        for ( i, choice ) in enumerate( choices ):
             
             radiobutton = QW.QRadioButton( choice, self )
             
             self._choices.append( radiobutton )
             
+            self._button_group.addButton( radiobutton, i )
+            
             radiobutton.clicked.connect( self.radioBoxChanged )
             
             self.layout().addWidget( radiobutton )
@@ -1659,25 +1698,12 @@ class RadioBox( QW.QFrame ):
     
     def _GetCurrentChoiceWidget( self ):
         
-        for choice in self._choices:
-            
-            if choice.isChecked():
-                
-                return choice
-                
-            
-        
-        return None
+        return self._button_group.checkedButton()
         
     
     def GetCurrentIndex( self ):
         
-        for i in range( len( self._choices ) ):
-            
-            if self._choices[ i ].isChecked(): return i
-            
-        
-        return -1
+        return self._button_group.checkedId()
         
     
     def SetStringSelection( self, str ):
@@ -1694,12 +1720,16 @@ class RadioBox( QW.QFrame ):
         
     
     def GetStringSelection( self ):
-
-        for i in range( len( self._choices ) ):
-
-            if self._choices[ i ].isChecked(): return self._choices[ i ].text()
-
-        return None
+        
+        button = self._button_group.checkedButton()
+        
+        if button is None:
+            
+            return None
+            
+        
+        return button.text()
+        
     
     def setFocus( self, reason ):
         
@@ -1747,12 +1777,17 @@ class DataRadioBox( QW.QFrame ):
         self._choices = []
         self._buttons_to_data = {}
         
+        # the group tracks which button is checked for us, so we can ask it rather than polling every button
+        self._button_group = QW.QButtonGroup( self )
+        
         for ( text, data ) in choice_tuples:
             
             radiobutton = QW.QRadioButton( text, self )
             
             self._choices.append( radiobutton )
             
+            self._button_group.addButton( radiobutton )
+            
             self._buttons_to_data[ radiobutton ] = data
             
             radiobutton.clicked.connect( self.radioBoxChanged )
@@ -1772,40 +1807,30 @@ class DataRadioBox( QW.QFrame ):
     
     def _GetCurrentChoiceWidget( self ):
         
-        for choice in self._choices:
-            
-            if choice.isChecked():
-                
-                return choice
-                
-            
-        
-        return None
+        return self._button_group.checkedButton()
         
     
     def GetValue( self ):
         
-        for ( button, data ) in self._buttons_to_data.items():
+        button = self._button_group.checkedButton()
+        
+        if button is None:
             
-            if button.isChecked():
-                
-                return data
-                
+            raise Exception( 'No button selected!' )
             
         
-        raise Exception( 'No button selected!' )
+        return self._buttons_to_data[ button ]
         
     
     def setFocus( self, reason ):
         
-        for button in self._choices:
+        button = self._button_group.checkedButton()
+        
+        if button is not None:
             
-            if button.isChecked():
-                
-                button.setFocus( reason )
-                
-                return
-                
+            button.setFocus( reason )
+            
+            return
             
         
         QW.QFrame.setFocus( self, reason )
@@ -1829,6 +1854,10 @@ class EllipsizedLabel( QW.QLabel ):
         
         self._ellipsize_end = ellipsize_end
         
+        # eliding is text shaping work, and the label repaints much more often than its text or width change
+        self._elided_lines_key = None
+        self._elided_lines = []
+        
     
     def minimumSizeHint( self ):
         
@@ -1888,7 +1917,7 @@ class EllipsizedLabel( QW.QLabel ):
 
         fontMetrics = painter.fontMetrics()
 
-        text_lines = self.text().split( '\n' )
+        text = self.text()
         
         line_spacing = fontMetrics.lineSpacing()
         
@@ -1898,14 +1927,22 @@ class EllipsizedLabel( QW.QLabel ):
         
         my_width = self.width()
         
-        for text_line in text_lines:
+        elided_lines_key = ( text, my_width, painter.font().key() )
+        
+        if elided_lines_key != self._elided_lines_key:
+            
+            self._elided_lines = [ fontMetrics.elidedText( text_line, QC.Qt.ElideRight, my_width ) for text_line in text.split( '\n' ) ]
             
-            elided_line = fontMetrics.elidedText( text_line, QC.Qt.ElideRight, my_width )
+            self._elided_lines_key = elided_lines_key
+            
+        
+        flags = self.alignment()
+        
+        for elided_line in self._elided_lines:
             
             x = 0
             width = my_width
             height = line_spacing
-            flags = self.alignment()
             
             painter.drawText( x, current_y, width, height, flags, elided_line )
             
@@ -2185,30 +2222,33 @@ class TreeWidgetWithInheritedCheckState( QW.QTreeWidget ):
         self.itemChanged.connect( self._HandleItemCheckStateUpdate )
         
     
-    def _GetChildren( self, item: QW.QTreeWidgetItem ) -> typing.List[ QW.QTreeWidgetItem ]:
-        
-        children = [ item.child( i ) for i in range( item.childCount() ) ]
-        
-        return children
-        
-    
     def _HandleItemCheckStateUpdate( self, item, column ):
         
-        self.blockSignals( True )
-        
-        self._UpdateChildrenCheckState( item, item.checkState( 0 ) )
-        self._UpdateParentCheckState( item )
-        
-        self.blockSignals( False )
+        # the blocker unblocks on exit even if something in here raises, so we can't get stuck silent
+        with QC.QSignalBlocker( self ):
+            
+            self._UpdateChildrenCheckState( item, item.checkState( 0 ) )
+            self._UpdateParentCheckState( item )
+            
         
     
     def _UpdateChildrenCheckState( self, item, check_state ):
         
-        for child in self._GetChildren( item ):
+        # iterative, so a deep tree doesn't cost a python frame per node or hit the recursion limit
+        items_to_process = [ item ]
+        
+        while len( items_to_process ) > 0:
             
-            child.setCheckState( 0, check_state )
+            item = items_to_process.pop()
             
-            self._UpdateChildrenCheckState( child, check_state )
+            for i in range( item.childCount() ):
+                
+                child = item.child( i )
+                
+                child.setCheckState( 0, check_state )
+                
+                items_to_process.append( child )
+                
             
         
     
@@ -2218,17 +2258,26 @@ class TreeWidgetWithInheritedCheckState( QW.QTreeWidget ):
         
         if isinstance( parent, QW.QTreeWidgetItem ):
             
-            all_values = { child.checkState( 0 ) for child in self._GetChildren( parent ) }
+            # all children the same state means the parent gets that state, anything mixed means partial, so we can stop at the first difference
+            end_state = None
             
-            if all_values == { QC.Qt.Checked }:
-                
-                end_state = QC.Qt.Checked
+            for i in range( parent.childCount() ):
                 
-            elif all_values == { QC.Qt.Unchecked }:
+                child_state = parent.child( i ).checkState( 0 )
                 
-                end_state = QC.Qt.Unchecked
+                if end_state is None:
+                    
+                    end_state = child_state
+                    
+                elif child_state != end_state:
+                    
+                    end_state = QC.Qt.PartiallyChecked
+                    
+                    break
+                    
                 
-            else:
+            
+            if end_state is None:
                 
                 end_state = QC.Qt.PartiallyChecked
                 
@@ -2260,6 +2309,26 @@ class WidgetEventFilter ( QC.QObject ):
     _mouse_tracking_required = { 'EVT_MOUSE_EVENTS' }
 
     _strong_focus_required = { 'EVT_KEY_DOWN' }
+    
+    _mouse_event_types = { QC.QEvent.MouseMove, QC.QEvent.MouseButtonDblClick, QC.QEvent.MouseButtonPress, QC.QEvent.MouseButtonRelease, QC.QEvent.Wheel }
+    
+    # which qt event types each of our event names needs to see
+    _evt_names_to_event_types = {
+        'EVT_KEY_DOWN' : { QC.QEvent.KeyPress },
+        'EVT_MAXIMIZE' : { QC.QEvent.WindowStateChange },
+        'EVT_MOUSE_EVENTS' : _mouse_event_types,
+        'EVT_LEFT_DCLICK' : { QC.QEvent.MouseButtonDblClick },
+        'EVT_RIGHT_DCLICK' : { QC.QEvent.MouseButtonDblClick },
+        'EVT_LEFT_DOWN' : { QC.QEvent.MouseButtonPress },
+        'EVT_MIDDLE_DOWN' : { QC.QEvent.MouseButtonPress },
+        'EVT_RIGHT_DOWN' : { QC.QEvent.MouseButtonPress },
+        'EVT_LEFT_UP' : { QC.QEvent.MouseButtonRelease },
+        'EVT_MOUSEWHEEL' : { QC.QEvent.Wheel },
+        'EVT_SCROLLWIN' : { QC.QEvent.Scroll },
+        'EVT_MOVE' : { QC.QEvent.Move },
+        'EVT_SIZE' : { QC.QEvent.Resize },
+        'EVT_MOVE_END' : { QC.QEvent.Move, QC.QEvent.NonClientAreaMouseButtonPress, QC.QEvent.NonClientAreaMouseButtonRelease }
+    }
 
     def __init__( self, parent_widget ):
 
@@ -2267,25 +2336,157 @@ class WidgetEventFilter ( QC.QObject ):
         
         QC.QObject.__init__( self, parent_widget )
         
-        parent_widget.installEventFilter( self )
-        
-        self._callback_map = defaultdict( list )
+        self._callback_map = {}
         
         self._user_moved_window = False # There is no EVT_MOVE_END in Qt so some trickery is required.
-
+        
+        # this filter sees every event the widget gets, so we go straight to the right handler rather than testing the type against a long elif chain
+        self._all_event_type_handlers = {
+            QC.QEvent.KeyPress : self._HandleKeyPress,
+            QC.QEvent.WindowStateChange : self._HandleWindowStateChange,
+            QC.QEvent.MouseMove : self._HandleMouseMove,
+            QC.QEvent.MouseButtonDblClick : self._HandleMouseButtonDblClick,
+            QC.QEvent.MouseButtonPress : self._HandleMouseButtonPress,
+            QC.QEvent.MouseButtonRelease : self._HandleMouseButtonRelease,
+            QC.QEvent.Wheel : self._HandleWheel,
+            QC.QEvent.Scroll : self._HandleScroll,
+            QC.QEvent.Move : self._HandleMove,
+            QC.QEvent.Resize : self._HandleResize,
+            QC.QEvent.NonClientAreaMouseButtonPress : self._HandleNonClientAreaMouseButtonPress,
+            QC.QEvent.NonClientAreaMouseButtonRelease : self._HandleNonClientAreaMouseButtonRelease
+        }
+        
+        # and we only look at the types something has registered for, so everything else is one dict miss
+        self._event_type_handlers = {}
+        
+        parent_widget.installEventFilter( self )
+        
+    
     def _ExecuteCallbacks( self, event_name, event ):
         
-        if event_name not in self._callback_map: return
+        callbacks = self._callback_map.get( event_name, None )
+        
+        if callbacks is None: return False
         
         event_killed = False
         
-        for callback in self._callback_map[ event_name ]:
+        for callback in callbacks:
             
             if not callback( event ): event_killed = True
             
         return event_killed
-
-
+        
+    
+    def _HandleKeyPress( self, event ):
+        
+        return self._ExecuteCallbacks( 'EVT_KEY_DOWN', event )
+        
+    
+    def _HandleWindowStateChange( self, event ):
+        
+        # eventFilter has already checked the parent is valid. we only care about entering or leaving maximised, not other state flips while it stays maximised
+        was_maximised = bool( event.oldState() & QC.Qt.WindowMaximized )
+        is_maximised = bool( self._parent_widget.windowState() & QC.Qt.WindowMaximized )
+        
+        if was_maximised != is_maximised: return self._ExecuteCallbacks( 'EVT_MAXIMIZE', event )
+        
+        return False
+        
+    
+    def _HandleMouseMove( self, event ):
+        
+        return self._ExecuteCallbacks( 'EVT_MOUSE_EVENTS', event )
+        
+    
+    def _HandleMouseButtonDblClick( self, event ):
+        
+        # once an event is killed, nothing further down gets to see it
+        
+        button = event.button()
+        
+        if button == QC.Qt.LeftButton:
+            
+            if self._ExecuteCallbacks( 'EVT_LEFT_DCLICK', event ): return True
+            
+        elif button == QC.Qt.RightButton:
+            
+            if self._ExecuteCallbacks( 'EVT_RIGHT_DCLICK', event ): return True
+            
+        
+        return self._ExecuteCallbacks( 'EVT_MOUSE_EVENTS', event )
+        
+    
+    def _HandleMouseButtonPress( self, event ):
+        
+        buttons = event.buttons()
+        
+        if buttons & QC.Qt.LeftButton and self._ExecuteCallbacks( 'EVT_LEFT_DOWN', event ): return True
+        
+        if buttons & QC.Qt.MiddleButton and self._ExecuteCallbacks( 'EVT_MIDDLE_DOWN', event ): return True
+        
+        if buttons & QC.Qt.RightButton and self._ExecuteCallbacks( 'EVT_RIGHT_DOWN', event ): return True
+        
+        return self._ExecuteCallbacks( 'EVT_MOUSE_EVENTS', event )
+        
+    
+    def _HandleMouseButtonRelease( self, event ):
+        
+        # buttons() on a release is what is still held, so we want button(), the one that was just let go
+        if event.button() == QC.Qt.LeftButton and self._ExecuteCallbacks( 'EVT_LEFT_UP', event ): return True
+        
+        return self._ExecuteCallbacks( 'EVT_MOUSE_EVENTS', event )
+        
+    
+    def _HandleWheel( self, event ):
+        
+        if self._ExecuteCallbacks( 'EVT_MOUSEWHEEL', event ): return True
+        
+        return self._ExecuteCallbacks( 'EVT_MOUSE_EVENTS', event )
+        
+    
+    def _HandleScroll( self, event ):
+        
+        return self._ExecuteCallbacks( 'EVT_SCROLLWIN', event )
+        
+    
+    def _HandleMove( self, event ):
+        
+        event_killed = self._ExecuteCallbacks( 'EVT_MOVE', event )
+        
+        if self._parent_widget.isVisible():
+            
+            self._user_moved_window = True
+            
+        
+        return event_killed
+        
+    
+    def _HandleResize( self, event ):
+        
+        return self._ExecuteCallbacks( 'EVT_SIZE', event )
+        
+    
+    def _HandleNonClientAreaMouseButtonPress( self, event ):
+        
+        self._user_moved_window = False
+        
+        return False
+        
+    
+    def _HandleNonClientAreaMouseButtonRelease( self, event ):
+        
+        event_killed = False
+        
+        if self._user_moved_window:
+            
+            event_killed = self._ExecuteCallbacks( 'EVT_MOVE_END', event )
+            
+            self._user_moved_window = False
+            
+        
+        return event_killed
+        
+    
     def eventFilter( self, watched, event ):
         
         try:
@@ -2294,90 +2495,9 @@ class WidgetEventFilter ( QC.QObject ):
             # Might be worth debugging this later if it still occurs - the only way I found to reproduce it is to run the help > debug > initialize server command
             if not hasattr( self, '_parent_widget') or not isValid( self._parent_widget ): return False
             
-            type = event.type()
-            
-            event_killed = False
-            
-            if type == QC.QEvent.KeyPress:
-                
-                event_killed = event_killed or self._ExecuteCallbacks( 'EVT_KEY_DOWN', event )
-                
-            elif type == QC.QEvent.WindowStateChange:
-                
-                if isValid( self._parent_widget ):
-                    
-                    if self._parent_widget.isMaximized() or (event.oldState() & QC.Qt.WindowMaximized): event_killed = event_killed or self._ExecuteCallbacks( 'EVT_MAXIMIZE', event )
+            handler = self._event_type_handlers.get( event.type(), None )
             
-            elif type == QC.QEvent.MouseMove:
-                
-                event_killed = event_killed or self._ExecuteCallbacks( 'EVT_MOUSE_EVENTS', event )
-                
-            elif type == QC.QEvent.MouseButtonDblClick:
-                
-                if event.button() == QC.Qt.LeftButton:
-                    
-                    event_killed = event_killed or self._ExecuteCallbacks( 'EVT_LEFT_DCLICK', event )
-                    
-                elif event.button() == QC.Qt.RightButton:
-                    
-                    event_killed = event_killed or self._ExecuteCallbacks( 'EVT_RIGHT_DCLICK', event )
-                    
-                
-                event_killed = event_killed or self._ExecuteCallbacks( 'EVT_MOUSE_EVENTS', event )
-                
-            elif type == QC.QEvent.MouseButtonPress:
-                
-                if event.buttons() & QC.Qt.LeftButton: event_killed = event_killed or self._ExecuteCallbacks( 'EVT_LEFT_DOWN', event )
-                
-                if event.buttons() & QC.Qt.MiddleButton: event_killed = event_killed or self._ExecuteCallbacks( 'EVT_MIDDLE_DOWN', event )
-                
-                if event.buttons() & QC.Qt.RightButton: event_killed = event_killed or self._ExecuteCallbacks( 'EVT_RIGHT_DOWN', event )
-                
-                event_killed = event_killed or self._ExecuteCallbacks( 'EVT_MOUSE_EVENTS', event )
-                
-            elif type == QC.QEvent.MouseButtonRelease:
-                
-                if event.buttons() & QC.Qt.LeftButton: event_killed = event_killed or self._ExecuteCallbacks( 'EVT_LEFT_UP', event )
-                
-                event_killed = event_killed or self._ExecuteCallbacks( 'EVT_MOUSE_EVENTS', event )
-                
-            elif type == QC.QEvent.Wheel:
-                
-                event_killed = event_killed or self._ExecuteCallbacks( 'EVT_MOUSEWHEEL', event )
-                
-                event_killed = event_killed or self._ExecuteCallbacks( 'EVT_MOUSE_EVENTS', event )
-                
-            elif type == QC.QEvent.Scroll:
-                
-                event_killed = event_killed or self._ExecuteCallbacks( 'EVT_SCROLLWIN', event )
-                
-            elif type == QC.QEvent.Move:
-                
-                event_killed = event_killed or self._ExecuteCallbacks( 'EVT_MOVE', event )
-                
-                if isValid( self._parent_widget ) and self._parent_widget.isVisible():
-                    
-                    self._user_moved_window = True
-                
-            elif type == QC.QEvent.Resize:
-                
-                event_killed = event_killed or self._ExecuteCallbacks( 'EVT_SIZE', event )
-                
-            elif type == QC.QEvent.NonClientAreaMouseButtonPress:
-                
-                self._user_moved_window = False
-                
-            elif type == QC.QEvent.NonClientAreaMouseButtonRelease:
-                
-                if self._user_moved_window:
-                    
-                    event_killed = event_killed or self._ExecuteCallbacks( 'EVT_MOVE_END', event )
-                    
-                    self._user_moved_window = False
-                    
-                
-            
-            if event_killed:
+            if handler is not None and handler( event ):
                 
                 event.accept()
                 
@@ -2404,7 +2524,13 @@ class WidgetEventFilter ( QC.QObject ):
             
             self._parent_widget.setFocusPolicy( QC.Qt.StrongFocus )
             
-        self._callback_map[ evt_name ].append( callback )
+        # binds are rare and events are not, so we rebuild a tuple here to keep iteration cheap
+        self._callback_map[ evt_name ] = self._callback_map.get( evt_name, () ) + ( callback, )
+        
+        for event_type in self._evt_names_to_event_types[ evt_name ]:
+            
+            self._event_type_handlers[ event_type ] = self._all_event_type_handlers[ event_type ]
+            
 
     def EVT_KEY_DOWN( self, callback ):
         
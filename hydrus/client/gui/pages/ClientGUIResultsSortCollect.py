@@ -53,6 +53,9 @@ class CollectComboCtrl( QW.QComboBox ):
         
         self.setModel( QG.QStandardItemModel( self ) )
         
+        # what we last put in the model, so an options refresh can compare against this rather than reading every item back out
+        self._current_text_and_data_tuples = []
+        
         self._ReinitialiseChoices()
         
         # Trick to display custom text
@@ -78,8 +81,6 @@ class CollectComboCtrl( QW.QComboBox ):
             item.setCheckState( QC.Qt.Checked )
             
         
-        self.SetValue( self._cached_text )
-        
         self.itemChanged.emit()
         
     
@@ -112,86 +113,76 @@ class CollectComboCtrl( QW.QComboBox ):
             text_and_data_tuples.append( ( star_ratings_service.GetName(), ( 'rating', star_ratings_service.GetServiceKey() ) ) )
             
         
-        current_text_and_data_tuples = []
+        made_changes = False
         
-        for i in range( self.count() ):
+        if self._current_text_and_data_tuples != text_and_data_tuples:
             
-            item = self.model().item( i, 0 )
+            model = self.model()
             
-            t = item.text()
-            d = self.itemData( i, QC.Qt.UserRole )
+            self.setUpdatesEnabled( False )
             
-            current_text_and_data_tuples.append( ( t, d ) )
-            
-        
-        made_changes = False
-        
-        if current_text_and_data_tuples != text_and_data_tuples:
-            
-            if self.count() > 0:
-                
-                # PRO TIP 4 U: if you say self.clear() here, the program has a ~15% chance to crash instantly if you have previously done a clear/add cycle!
-                # this affects PyQt and PySide, 5 and 6, running from source, so must be something in Qt core. some argument between the model and widget
-                self.model().clear()
+            try:
                 
-            
-            for ( text, data ) in text_and_data_tuples:
+                if self.count() > 0:
+                    
+                    # PRO TIP 4 U: if you say self.clear() here, the program has a ~15% chance to crash instantly if you have previously done a clear/add cycle!
+                    # this affects PyQt and PySide, 5 and 6, running from source, so must be something in Qt core. some argument between the model and widget
+                    model.clear()
+                    
                 
-                self.addItem( text, userData = data )
+                for ( text, data ) in text_and_data_tuples:
+                    
+                    # set everything up before it goes in the model, so each row is one insert rather than an insert and then a check state change
+                    item = QG.QStandardItem( text )
+                    
+                    item.setData( data, QC.Qt.UserRole )
+                    item.setCheckState( QC.Qt.Unchecked )
+                    
+                    model.appendRow( item )
+                    
                 
-                item = self.model().item( self.count() - 1, 0 )
+            finally:
                 
-                item.setCheckState( QC.Qt.Unchecked )
+                self.setUpdatesEnabled( True )
                 
             
+            self._current_text_and_data_tuples = text_and_data_tuples
+            
             made_changes = True
             
         
         return made_changes
         
     
-    def GetCheckedIndices( self ):
+    def _GetCheckedItems( self ):
         
-        indices = []
+        model = self.model()
         
-        for idx in range( self.count() ):
-
-            item = self.model().item( idx )
-            
-            if item.checkState() == QC.Qt.Checked:
-                
-                indices.append( idx )
-                
-            
+        items = ( model.item( idx ) for idx in range( self.count() ) )
         
-        return indices
+        return [ item for item in items if item.checkState() == QC.Qt.Checked ]
         
-
-    def GetCheckedStrings( self ):
+    
+    def GetCheckedIndices( self ):
         
-        strings = [ ]
+        return [ item.row() for item in self._GetCheckedItems() ]
         
-        for idx in range( self.count() ):
-            
-            item = self.model().item( idx )
-            
-            if item.checkState() == QC.Qt.Checked:
-                
-                strings.append( item.text() )
-                
-            
+
+    def GetCheckedStrings( self ):
         
-        return strings
+        return [ item.text() for item in self._GetCheckedItems() ]
         
     
     def GetValues( self ):
         
         namespaces = []
         rating_service_keys = []
+        collect_strings = []
         
-        for index in self.GetCheckedIndices():
+        # one walk of the model for the data and the label
+        for item in self._GetCheckedItems():
             
-            ( collect_type, collect_data ) = self.itemData( index, QC.Qt.UserRole )
+            ( collect_type, collect_data ) = item.data( QC.Qt.UserRole )
             
             if collect_type == 'namespace':
                 
@@ -202,8 +193,8 @@ class CollectComboCtrl( QW.QComboBox ):
                 rating_service_keys.append( collect_data )
                 
             
-        
-        collect_strings = self.GetCheckedStrings()
+            collect_strings.append( item.text() )
+            
         
         if len( collect_strings ) > 0:
             
@@ -248,10 +239,18 @@ class CollectComboCtrl( QW.QComboBox ):
     
     def SetValue( self, text ):
         
+        if text == self._cached_text:
+            
+            return
+            
+        
         self._cached_text = text
         
         self.setCurrentText( text )
         
+        # paintEvent draws _cached_text, and setCurrentText does not repaint unless it happens to match an item
+        self.update()
+        
         
     
     def SetCollectByValue( self, media_collect ):
@@ -259,13 +258,18 @@ class CollectComboCtrl( QW.QComboBox ):
         try:
             
             indices_to_check = []
+            
+            namespaces = set( media_collect.namespaces )
+            rating_service_keys = set( media_collect.rating_service_keys )
+            
+            model = self.model()
 
             for index in range( self.count() ):
 
-                ( collect_type, collect_data ) = self.itemData( index, QC.Qt.UserRole )
+                ( collect_type, collect_data ) = model.item( index ).data( QC.Qt.UserRole )
 
-                p1 = collect_type == 'namespace' and collect_data in media_collect.namespaces
-                p2 = collect_type == 'rating' and collect_data in media_collect.rating_service_keys
+                p1 = collect_type == 'namespace' and collect_data in namespaces
+                p2 = collect_type == 'rating' and collect_data in rating_service_keys
 
                 if p1 or p2:
                     
@@ -287,17 +291,27 @@ class CollectComboCtrl( QW.QComboBox ):
 
     def SetCheckedIndices( self, indices_to_check ):
         
+        indices_to_check = set( indices_to_check )
+        
+        model = self.model()
+        
         for idx in range( self.count() ):
 
-            item = self.model().item( idx )
+            item = model.item( idx )
             
             if idx in indices_to_check:
                 
-                item.setCheckState( QC.Qt.Checked )
+                check_state = QC.Qt.Checked
                 
             else:
                 
-                item.setCheckState( QC.Qt.Unchecked )
+                check_state = QC.Qt.Unchecked
+                
+            
+            # every set sends a dataChanged through the view, so only touch rows that are actually changing
+            if item.checkState() != check_state:
+                
+                item.setCheckState( check_state )
                 
             
         
@@ -384,7 +398,7 @@ class MediaCollectControl( QW.QWidget ):
         
         ( namespaces, rating_service_keys, description ) = self._collect_comboctrl.GetValues()
         
-        self._UpdateLabel()
+        self._collect_comboctrl.SetValue( description )
         
         collect_unmatched = self._collect_unmatched.GetValue()
         
@@ -482,6 +496,9 @@ class MediaSortControl( QW.QWidget ):
         
         self._sort_type = ( 'system', CC.SORT_FILES_BY_FILESIZE )
         
+        # the flat list of sort types, for mouse wheel scrolling. cleared when options or services change
+        self._sort_types_cache = None
+        
         self._sort_type_button = ClientGUICommon.BetterButton( self, 'sort', self._SortTypeButtonClick )
         self._sort_tag_display_type_button = ClientGUIMenuButton.MenuChoiceButton( self, [] )
         self._sort_order_choice = ClientGUIMenuButton.MenuChoiceButton( self, [] )
@@ -532,6 +549,9 @@ class MediaSortControl( QW.QWidget ):
         self._sort_order_choice.valueChanged.connect( self.EventSortAscChoice )
         self._tag_context_button.valueChanged.connect( self.EventTagContextChanged )
         
+        CG.client_controller.sub( self, 'NotifyNewOptions', 'notify_new_options' )
+        CG.client_controller.sub( self, 'NotifyNewServices', 'notify_new_services_gui' )
+        
     
     def _BroadcastSort( self ):
         
@@ -558,6 +578,11 @@ class MediaSortControl( QW.QWidget ):
     
     def _PopulateSortMenuOrList( self, menu = None ):
         
+        if menu is None and self._sort_types_cache is not None:
+            
+            return self._sort_types_cache
+            
+        
         sort_types = []
         
         menu_items_and_sort_types = []
@@ -674,6 +699,8 @@ class MediaSortControl( QW.QWidget ):
                 
             
         
+        self._sort_types_cache = sort_types
+        
         return sort_types
         
     
@@ -731,7 +758,8 @@ class MediaSortControl( QW.QWidget ):
     
     def _UpdateAscDescLabelsAndDefault( self ):
         
-        media_sort = self._GetCurrentSort()
+        # the asc/desc labels only depend on the sort type, so no need to read the order and tag context buttons
+        media_sort = ClientMedia.MediaSort( self._sort_type, CC.SORT_ASC )
         
         self._sort_order_choice.blockSignals( True )
         
@@ -801,7 +829,11 @@ class MediaSortControl( QW.QWidget ):
                 
                 self._sort_tag_display_type_button.blockSignals( True )
                 
-                self._sort_tag_display_type_button.SetChoiceTuples( choice_tuples )
+                # these are the same every time, so we only need to build the menu the first time through
+                if choice_tuples != self._sort_tag_display_type_button.GetChoiceTuples():
+                    
+                    self._sort_tag_display_type_button.SetChoiceTuples( choice_tuples )
+                    
                 
                 self._sort_tag_display_type_button.SetValue( current_tag_display_type )
                 
@@ -869,6 +901,16 @@ class MediaSortControl( QW.QWidget ):
         self._UpdateButtonsVisible()
         
     
+    def NotifyNewOptions( self ):
+        
+        self._sort_types_cache = None
+        
+    
+    def NotifyNewServices( self ):
+        
+        self._sort_types_cache = None
+        
+    
     def SetSort( self, media_sort: ClientMedia.MediaSort, do_sort = False ):
         
         self._SetSortType( media_sort.sort_type )
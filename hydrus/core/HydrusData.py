@@ -22,6 +22,8 @@ from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusText
 
+INT_HAS_BIT_COUNT = hasattr( int, 'bit_count' ) # python 3.10+
+
 def default_dict_list(): return collections.defaultdict( list )
 
 def default_dict_set(): return collections.defaultdict( set )
@@ -230,6 +232,10 @@ def ConvertNumericalRatingToPrettyString( lower, upper, rating, rounded_result =
     
     return s
     
+def ConvertPerceptualHashToInt( perceptual_hash: bytes ) -> int:
+    
+    return struct.unpack( '!Q', perceptual_hash )[0]
+    
 def ConvertPixelsToInt( unit ):
     
     if unit == 'pixels': return 1
@@ -398,6 +404,21 @@ def Get64BitHammingDistance( perceptual_hash1, perceptual_hash2 ):
     
     # another option is https://www.valuedlessons.com/2009/01/popcount-in-python-with-benchmarks.html, which is just an array where the byte value is an address on a list to the answer
     
+def Get64BitHammingDistanceFromInts( perceptual_hash_int_1: int, perceptual_hash_int_2: int ) -> int:
+    
+    # for hot loops that have already decoded their perceptual hashes with ConvertPerceptualHashToInt, so we skip the struct.unpack every comparison
+    
+    n = perceptual_hash_int_1 ^ perceptual_hash_int_2
+    
+    if INT_HAS_BIT_COUNT:
+        
+        return n.bit_count()
+        
+    else:
+        
+        return bin( n ).count( '1' )
+        
+    
 def GetNicelyDivisibleNumberForZoom( zoom, no_bigger_than ):
     
     # it is most convenient to have tiles that line up with the current zoom ratio
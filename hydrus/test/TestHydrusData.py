@@ -19,3 +19,18 @@ class TestHydrusData( unittest.TestCase ):
         self.assertEqual( HydrusData.ConvertIntToPrettyOrdinalString( 1011 ), '1,011th' )
         
     
+    def test_hamming_distance( self ):
+        
+        perceptual_hash_1 = bytes.fromhex( '0000000000000000' )
+        perceptual_hash_2 = bytes.fromhex( '00000000000000ff' )
+        perceptual_hash_3 = bytes.fromhex( 'f0000000000000f0' )
+        
+        self.assertEqual( HydrusData.Get64BitHammingDistance( perceptual_hash_1, perceptual_hash_2 ), 8 )
+        self.assertEqual( HydrusData.Get64BitHammingDistance( perceptual_hash_2, perceptual_hash_3 ), 8 )
+        
+        for ( a, b ) in [ ( perceptual_hash_1, perceptual_hash_2 ), ( perceptual_hash_2, perceptual_hash_3 ), ( perceptual_hash_3, perceptual_hash_3 ) ]:
+            
+            self.assertEqual( HydrusData.Get64BitHammingDistanceFromInts( HydrusData.ConvertPerceptualHashToInt( a ), HydrusData.ConvertPerceptualHashToInt( b ) ), HydrusData.Get64BitHammingDistance( a, b ) )
+            
+        
+    